@@ -0,0 +1,143 @@
+"""Micro-benchmarks for the hot repository methods at 1k, 10k and 100k players.
+
+    pytest benchmarks/bench_repositories.py
+"""
+
+import asyncio
+import itertools
+import random
+import shutil
+
+import discord
+import pytest
+import pytest_asyncio
+
+from database import Database
+from database.assassins import PlayerStatus, TABLE_NAME
+
+SIZES = [1_000, 10_000, 100_000]
+GUILD = discord.Object(id=1)
+
+
+async def build(path: str, players: int) -> None:
+    """Create a database with `players` players in one guild and a guild per 10 players."""
+    db = Database(path)
+    await db.open()
+    try:
+        await db.migrate()
+        await db.guilds.add_guilds(range(1, players // 10 + 1))
+        await db.run_many(
+            f"INSERT INTO {TABLE_NAME} (guildID, name, email, discordID, status) VALUES (?, ?, ?, ?, ?);",
+            (
+                (GUILD.id, f"Player {i}", f"{i}@tamu.edu", i, PlayerStatus.ALIVE.value)
+                for i in range(1, players + 1)
+            ),
+        )
+    finally:
+        await db.close()
+
+
+@pytest.fixture(scope="session")
+def templates(tmp_path_factory):
+    """Database files for every size, built once and copied for each benchmark."""
+    directory = tmp_path_factory.mktemp("templates")
+    paths = {}
+    for players in SIZES:
+        paths[players] = str(directory / f"{players}.db")
+        asyncio.run(build(paths[players], players))
+    return paths
+
+
+@pytest_asyncio.fixture(params=SIZES, ids=lambda players: f"{players}")
+async def db(request, templates, tmp_path):
+    path = str(tmp_path / "unite.db")
+    shutil.copy(templates[request.param], path)
+    database = Database(path)
+    await database.open()
+    database.players = request.param
+    yield database
+    await database.close()
+
+
+def players(db: Database):
+    """Endless random existing players."""
+    rng = random.Random(0)
+    while True:
+        yield discord.Object(id=rng.randint(1, db.players))
+
+
+@pytest.mark.asyncio
+async def test_add_player(db, benchmark):
+    ids = itertools.count(db.players + 1)
+
+    async def add():
+        discordID = next(ids)
+        await db.assassins.add_player(
+            GUILD, "New Player", f"{discordID}@tamu.edu", discord.Object(id=discordID), ""
+        )
+
+    await benchmark(add)
+
+
+@pytest.mark.asyncio
+async def test_get_player_by_discord_id(db, benchmark):
+    members = players(db)
+
+    async def get():
+        return await db.assassins.get_player_by_discord_id(GUILD, next(members))
+
+    assert await benchmark(get, rounds=1000) is not None
+
+
+@pytest.mark.asyncio
+async def test_get_all_players(db, benchmark):
+    result = await benchmark(db.assassins.get_all_players, GUILD, rounds=10, warmup=1)
+    assert len(result) == db.players
+
+
+@pytest.mark.asyncio
+async def test_set_player_status(db, benchmark):
+    members = players(db)
+
+    async def set_status():
+        await db.assassins.set_player_status(GUILD, next(members), PlayerStatus.DEAD)
+
+    await benchmark(set_status)
+
+
+@pytest.mark.asyncio
+async def test_get_prefix_cached(db, benchmark):
+    await db.guilds.load_prefixes()
+    guilds = [discord.Object(id=i) for i in range(1, db.players // 10 + 1)]
+    rng = random.Random(0)
+
+    async def get():
+        return await db.guilds.get_prefix(rng.choice(guilds))
+
+    await benchmark(get, rounds=10_000)
+
+
+@pytest.mark.asyncio
+async def test_get_prefix_uncached(db, benchmark):
+    rng = random.Random(0)
+    guild = discord.Object(id=0)
+
+    async def evict():
+        # Look up a different guild each round with an empty cache
+        guild.id = rng.randint(1, db.players // 10)
+        db.guilds._prefixes.clear()
+
+    await benchmark(db.guilds.get_prefix, guild, rounds=1000, setup=evict)
+
+
+@pytest.mark.asyncio
+async def test_mass_reset(db, benchmark):
+    async def start_game():
+        await db.run(
+            f"UPDATE {TABLE_NAME} SET status = ? WHERE guildID = ?;",
+            (PlayerStatus.ALIVE.value, GUILD.id),
+        )
+
+    await benchmark(
+        db.assassins.finish_game, GUILD, rounds=5, warmup=1, setup=start_game
+    )
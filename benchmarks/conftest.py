@@ -0,0 +1,72 @@
+"""A small `benchmark` fixture in the style of pytest-benchmark.
+
+Benchmark modules are named `bench_*.py` so the default `pytest` run does not
+collect them; run them by path, e.g. `pytest benchmarks/bench_repositories.py`.
+"""
+
+import statistics
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+import pytest
+
+_results: List["Benchmark"] = []
+
+
+class Benchmark:
+    """Times an async callable over a number of rounds."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+
+    async def __call__(
+        self,
+        work: Callable[..., Awaitable[Any]],
+        *args: Any,
+        rounds: int = 200,
+        warmup: int = 5,
+        setup: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        """Run `work(*args)` `rounds` times after `warmup` untimed runs.
+
+        `setup` runs untimed before every round, for work that needs fresh state.
+        """
+        result = None
+        for iteration in range(warmup + rounds):
+            if setup is not None:
+                await setup()
+            started = time.perf_counter()
+            result = await work(*args)
+            if iteration >= warmup:
+                self.latencies.append(time.perf_counter() - started)
+
+        _results.append(self)
+        return result
+
+    def summary(self) -> str:
+        total = sum(self.latencies)
+        quantiles = statistics.quantiles(self.latencies, n=100, method="inclusive")
+        return (
+            f"{self.name:<60} {len(self.latencies):>6} {len(self.latencies) / total:>10.0f}"
+            f" {quantiles[49] * 1e3:>9.3f} {quantiles[94] * 1e3:>9.3f}"
+            f" {quantiles[98] * 1e3:>9.3f} {max(self.latencies) * 1e3:>9.3f}"
+        )
+
+
+@pytest.fixture
+def benchmark(request) -> Benchmark:
+    return Benchmark(request.node.name)
+
+
+def pytest_terminal_summary(terminalreporter) -> None:
+    if not _results:
+        return
+
+    terminalreporter.section("benchmarks")
+    terminalreporter.write_line(
+        f"{'name':<60} {'rounds':>6} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9}"
+        f" {'p99 ms':>9} {'max ms':>9}"
+    )
+    for result in _results:
+        terminalreporter.write_line(result.summary())
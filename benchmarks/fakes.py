@@ -0,0 +1,145 @@
+"""Local stand-ins for the Discord objects the cogs use.
+
+They implement just the attributes and coroutines the commands touch. Every
+call that would reach the Discord API is recorded and, to keep the event
+loop's workload realistic, waits a simulated round trip of `rtt` seconds.
+"""
+
+import asyncio
+import itertools
+from typing import Any, Dict, List, Optional
+
+import discord
+
+# Snowflake-sized IDs for interactions and messages
+_snowflakes = itertools.count(1_000_000_000_000_000_000)
+
+
+class FakeMessage:
+    def __init__(self, rtt: float, **fields: Any):
+        self.id = next(_snowflakes)
+        self.rtt = rtt
+        self.fields = fields
+
+    @property
+    def embed(self) -> Optional[discord.Embed]:
+        embeds = self.fields.get("embeds") or [self.fields.get("embed")]
+        return embeds[0]
+
+    async def edit(self, **fields: Any) -> "FakeMessage":
+        await asyncio.sleep(self.rtt)
+        self.fields.update(fields)
+        return self
+
+    async def delete(self) -> None:
+        await asyncio.sleep(self.rtt)
+
+
+class FakeChannel:
+    def __init__(self, channelID: int, rtt: float):
+        self.id = channelID
+        self.rtt = rtt
+        self.mention = f"<#{channelID}>"
+        self.messages: List[FakeMessage] = []
+
+    async def send(self, content: str = None, **fields: Any) -> FakeMessage:
+        await asyncio.sleep(self.rtt)
+        message = FakeMessage(self.rtt, content=content, **fields)
+        self.messages.append(message)
+        return message
+
+
+class FakeMember:
+    def __init__(self, memberID: int, name: str):
+        self.id = memberID
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{memberID}>"
+        self.bot = False
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guildID: int, name: str, rtt: float):
+        self.id = guildID
+        self.name = name
+        self.members: Dict[int, FakeMember] = {}
+        self.channels: Dict[int, FakeChannel] = {}
+        self.rtt = rtt
+
+    def add_member(self, memberID: int, name: str) -> FakeMember:
+        member = self.members[memberID] = FakeMember(memberID, name)
+        return member
+
+    def add_channel(self, channelID: int) -> FakeChannel:
+        channel = self.channels[channelID] = FakeChannel(channelID, self.rtt)
+        return channel
+
+    def get_member(self, memberID: int) -> Optional[FakeMember]:
+        return self.members.get(memberID)
+
+    def get_channel(self, channelID: int) -> Optional[FakeChannel]:
+        return self.channels.get(channelID)
+
+
+class FakeResponse:
+    """The `interaction.response` half of the API, answering any view it is sent."""
+
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(
+        self, content: str = None, *, view: discord.ui.View = None, **fields: Any
+    ) -> None:
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+
+        await asyncio.sleep(self._interaction.rtt)
+        self._done = True
+        self._interaction.message = FakeMessage(
+            self._interaction.rtt, content=content, view=view, **fields
+        )
+        if view is not None:
+            asyncio.get_running_loop().call_soon(self._press, view)
+
+    async def defer(self, **kwargs: Any) -> None:
+        await asyncio.sleep(self._interaction.rtt)
+        self._done = True
+
+    def _press(self, view: discord.ui.View) -> None:
+        # Stands in for the user pressing Confirm or Cancel on a ConfirmationView
+        view.value = self._interaction.confirm
+        view.stop()
+
+
+class FakeInteraction:
+    def __init__(
+        self,
+        guild: FakeGuild,
+        user: FakeMember,
+        command: Any = None,
+        *,
+        rtt: float = 0.0,
+        confirm: bool = True,
+    ):
+        self.id = next(_snowflakes)
+        self.type = discord.InteractionType.application_command
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.command = command
+        self.rtt = rtt
+        self.confirm = confirm
+        self.extras: Dict[str, Any] = {}
+        self.message: Optional[FakeMessage] = None
+        self.response = FakeResponse(self)
+
+    async def original_response(self) -> FakeMessage:
+        await asyncio.sleep(self.rtt)
+        return self.message
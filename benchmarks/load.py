@@ -0,0 +1,265 @@
+"""Replays scripted Discord traffic against UniteBot with local stand-ins.
+
+Every player registers and joins concurrently, an admin starts the game,
+waves of concurrent /eliminate calls play it out and the admin ends it.
+Commands run through the bot's command tree checks and instrumentation, and
+photo URLs are validated against a local image server.
+
+    python -m benchmarks.load --players 2000 --rtt 50
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Awaitable, Dict, Iterable, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import bot as unite
+from database.assassins import PlayerStatus
+from utils.constants import EmbedColors
+
+from benchmarks.fakes import FakeGuild, FakeInteraction, FakeMember
+
+GUILD_ID = 1
+CHANNEL_ID = 2
+
+
+class CommandStats:
+    __slots__ = ("latencies", "errors", "rejected")
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.rejected = 0
+
+    def summary(self, name: str) -> str:
+        calls = len(self.latencies)
+        # quantiles needs two samples, which one-off commands like /start lack
+        quantiles = statistics.quantiles(self.latencies * 2, n=100, method="inclusive")
+        return (
+            f"/{name:<12} {calls:>7} {self.errors / calls:>7.1%} {self.rejected / calls:>9.1%}"
+            f" {quantiles[49] * 1e3:>9.1f} {quantiles[94] * 1e3:>9.1f}"
+            f" {quantiles[98] * 1e3:>9.1f} {max(self.latencies) * 1e3:>9.1f}"
+        )
+
+
+class Harness:
+    """Invokes application commands on a bot as if Discord had sent them."""
+
+    def __init__(self, bot: unite.UniteBot, guild: FakeGuild, *, rtt: float):
+        self.bot = bot
+        self.guild = guild
+        self.rtt = rtt
+        self.stats: Dict[str, CommandStats] = {}
+
+    async def invoke(
+        self, name: str, user: FakeMember, /, *, confirm: bool = True, **options
+    ) -> FakeInteraction:
+        """Run a command to completion and record its latency and outcome.
+
+        Errors count uncaught exceptions; rejections count commands answered
+        with a red embed, such as an invalid registration or a lost race.
+        """
+        command = self.bot.tree.get_command(name)
+        interaction = FakeInteraction(
+            self.guild, user, command, rtt=self.rtt, confirm=confirm
+        )
+        stats = self.stats.setdefault(name, CommandStats())
+
+        started = time.perf_counter()
+        try:
+            await self.bot.tree.interaction_check(interaction)
+            await command.callback(command.binding, interaction, **options)
+        except Exception:
+            stats.errors += 1
+            self.bot.finish_interaction(interaction, error=True)
+            logging.exception(f"/{name} failed")
+        else:
+            self.bot.finish_interaction(interaction)
+        stats.latencies.append(time.perf_counter() - started)
+
+        embed = interaction.message.embed if interaction.message else None
+        if embed is not None and embed.color == EmbedColors.RED:
+            stats.rejected += 1
+        return interaction
+
+
+async def gather(calls: Iterable[Awaitable], concurrency: int) -> None:
+    """Run the calls with at most `concurrency` in flight at once."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(call: Awaitable) -> None:
+        async with semaphore:
+            await call
+
+    await asyncio.gather(*(limited(call) for call in calls))
+
+
+async def phase(name: str, calls: Iterable[Awaitable], concurrency: int) -> None:
+    started = time.perf_counter()
+    await gather(calls, concurrency)
+    print(f"{name:<10} {time.perf_counter() - started:>8.2f}s")
+
+
+def full_name(playerID: int) -> str:
+    """A name /register accepts, which only allows letters and spaces."""
+    letters = ""
+    while playerID:
+        playerID, index = divmod(playerID - 1, 26)
+        letters = chr(ord("a") + index) + letters
+    return f"Player {letters.capitalize()}"
+
+
+async def photo_server() -> TestServer:
+    async def photo(request: web.Request) -> web.Response:
+        return web.Response(body=b"\x89PNG", content_type="image/png")
+
+    app = web.Application()
+    app.router.add_route("*", "/photos/{name}", photo)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def simulate(
+    players: int, kills: int, concurrency: int, rtt: float, wal: bool, seed: int
+) -> Harness:
+    with tempfile.TemporaryDirectory() as directory:
+        # Start the bot the way setup_hook does, minus the gateway login
+        unite.DB_NAME = os.path.join(directory, "load.db")
+        unite.DB_WAL = wal
+        photos = await photo_server()
+        bot = unite.UniteBot()
+        async with bot:
+            await bot.load_database()
+            await bot.images.open()
+            bot.metrics.start()
+            for extension in ("cogs.admin", "cogs.assassins"):
+                await bot.load_extension(extension)
+
+            guild = FakeGuild(GUILD_ID, "Load Test", rtt)
+            bot.get_channel = guild.get_channel
+            await bot.db.guilds.add_guilds([guild.id])
+            await bot.db.guilds.set_channel(guild, "assassins", guild.add_channel(CHANNEL_ID))
+
+            members = [guild.add_member(i, full_name(i)) for i in range(1, players + 1)]
+            admin = members[0]
+            harness = Harness(bot, guild, rtt=rtt)
+
+            await phase(
+                "register",
+                (
+                    harness.invoke(
+                        "register",
+                        member,
+                        name=member.name,
+                        email=f"player{member.id}@tamu.edu",
+                        photo_url=str(photos.make_url(f"/photos/{member.id}.png")),
+                    )
+                    for member in members
+                ),
+                concurrency,
+            )
+            await phase("join", (harness.invoke("join", m) for m in members), concurrency)
+            await phase("start", [harness.invoke("start", admin)], 1)
+
+            # Waves of concurrent eliminations by random survivors, some of which
+            # lose races to kills made in the same wave
+            rng = random.Random(seed)
+            started = time.perf_counter()
+            remaining = kills
+            while remaining > 0:
+                alive = await bot.db.assassins.get_player_ids_by_status(
+                    guild, PlayerStatus.ALIVE
+                )
+                if len(alive) < 2:
+                    break
+                killers = rng.sample(alive, min(concurrency, remaining, len(alive)))
+                await gather(
+                    (harness.invoke("eliminate", guild.members[k]) for k in killers),
+                    concurrency,
+                )
+                after = await bot.db.assassins.get_player_ids_by_status(
+                    guild, PlayerStatus.ALIVE
+                )
+                remaining -= len(alive) - len(after)
+            print(f"{'eliminate':<10} {time.perf_counter() - started:>8.2f}s")
+
+            await phase("end", [harness.invoke("end", admin)], 1)
+            # Unloading the cog posts any announcements still being coalesced
+            await bot.unload_extension("cogs.assassins")
+            report(harness)
+
+        await photos.close()
+    return harness
+
+
+def percentiles(histogram) -> str:
+    values = histogram.percentiles(0.5, 0.95, 0.99)
+    if values[0] is None:
+        return "no samples"
+    return ", ".join(
+        f"p{q} {value * 1e3:.2f}ms" for q, value in zip((50, 95, 99), values)
+    )
+
+
+def report(harness: Harness) -> None:
+    bot = harness.bot
+    print()
+    print(
+        f"{'command':<13} {'calls':>7} {'errors':>7} {'rejected':>9} {'p50 ms':>9}"
+        f" {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    )
+    for name, stats in harness.stats.items():
+        print(stats.summary(name))
+
+    print()
+    print(f"Event loop lag: {percentiles(bot.metrics.loopLag)}")
+    print(f"Database latency: {percentiles(bot.db.latency)}")
+    print(
+        f"Coalesced reads: {bot.db.coalescedReads}/{bot.db.reads}"
+        f" ({bot.db.coalescedReads / max(bot.db.reads, 1):.1%})"
+    )
+    print("Queries by total time:")
+    for query, timing in bot.instruments.top(bot.instruments.queries, 5):
+        print(f"  {timing.sum:>8.3f}s {timing.count:>7} calls  {query[:90]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument(
+        "--kills", type=int, default=None, help="Kills before /end (default: half the players)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=None, help="Commands in flight (default: all)"
+    )
+    parser.add_argument(
+        "--rtt", type=float, default=50, help="Simulated Discord round trip in ms"
+    )
+    parser.add_argument("--wal", action="store_true", help="Use the WAL storage mode")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(
+        simulate(
+            args.players,
+            args.players // 2 if args.kills is None else args.kills,
+            args.concurrency or args.players,
+            args.rtt / 1000,
+            args.wal,
+            args.seed,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Replays a full Assassins game against the target-ring engine.
+
+Every kill is made by a random surviving player, through the same repository
+methods the cog uses, until one player is left standing.
+
+    python -m benchmarks.target_ring --players 100001
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import discord
+
+from database import Database
+from database.assassins import PlayerStatus, TABLE_NAME
+
+
+async def simulate(players: int, seed: int, wal: bool) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, "ring.db"), wal=wal)
+        await db.open()
+        try:
+            await db.migrate()
+
+            guild = discord.Object(id=1)
+            await db.run_many(
+                f"INSERT INTO {TABLE_NAME} (guildID, name, email, discordID, status) VALUES (?, ?, ?, ?, ?);",
+                (
+                    (guild.id, f"Player {i}", f"{i}@tamu.edu", i, PlayerStatus.ALIVE.value)
+                    for i in range(1, players + 1)
+                ),
+            )
+
+            started = time.perf_counter()
+            await db.assassins.assign_targets(guild, seed)
+            print(f"Assigned {players} targets in {time.perf_counter() - started:.3f}s")
+
+            # Survivors are kept in a list with an index so a random killer can be
+            # picked and a victim removed in constant time
+            rng = random.Random(seed)
+            alive = list(range(1, players + 1))
+            position = {playerID: index for index, playerID in enumerate(alive)}
+            latencies = []
+
+            started = time.perf_counter()
+            while len(alive) > 1:
+                killer = alive[rng.randrange(len(alive))]
+                before = time.perf_counter()
+                victimID, _ = await db.assassins.eliminate_target(
+                    guild, discord.Object(id=killer)
+                )
+                latencies.append(time.perf_counter() - before)
+
+                index = position.pop(victimID)
+                last = alive.pop()
+                if last != victimID:
+                    alive[index] = last
+                    position[last] = index
+            elapsed = time.perf_counter() - started
+
+            survivors = await db.assassins.get_player_ids_by_status(
+                guild, PlayerStatus.ALIVE
+            )
+            assert survivors == alive, "the ring did not end with a single winner"
+
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(f"Replayed {len(latencies)} kills in {elapsed:.3f}s ({len(latencies) / elapsed:.0f} kills/s)")
+            print(
+                f"Kill latency: p50 {quantiles[49] * 1e3:.3f}ms, "
+                f"p95 {quantiles[94] * 1e3:.3f}ms, p99 {quantiles[98] * 1e3:.3f}ms"
+            )
+        finally:
+            # Write out stat changes still being flushed before the database closes
+            await db.assassins.counters.close()
+            await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=100001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--wal", action="store_true", help="Use the WAL storage mode")
+    args = parser.parse_args()
+
+    asyncio.run(simulate(args.players, args.seed, args.wal))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 import os
+import time
 import logging
 import platform
 from dotenv import load_dotenv, find_dotenv
 
 import discord
+from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import Context
 
 from database import Database
+from database.backups import Backups
+from database.guilds import DEFAULT_PREFIX
+from utils.metrics import Instrumentation, MetricsServer, RuntimeMetrics
+from utils.utils import ImageValidator
 
 INITIAL_EXTENSIONS = ["cogs.owner", "cogs.admin", "cogs.assassins"]
 
@@ -15,6 +21,27 @@ INITIAL_EXTENSIONS = ["cogs.owner", "cogs.admin", "cogs.assassins"]
 load_dotenv(find_dotenv())
 TOKEN = os.getenv("DISCORD_TOKEN")
 DB_NAME = os.getenv("DB_NAME")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+DB_WAL = os.getenv("DB_WAL", "false").lower() in ("1", "true", "yes")
+DB_READ_AFTER_WRITE = os.getenv("DB_READ_AFTER_WRITE", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Statements slower than this are logged with their query plan; unset disables it
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS") or 0) or None
+# Seconds between background ANALYZE/vacuum/checkpoint runs; 0 disables them
+DB_MAINTENANCE_INTERVAL = float(os.getenv("DB_MAINTENANCE_INTERVAL") or 3600)
+# Online backups go to DB_BACKUP_DIR (default: "backups" beside the database)
+# every DB_BACKUP_INTERVAL seconds, 0 disabling them, keeping the newest DB_BACKUP_KEEP
+DB_BACKUP_DIR = os.getenv("DB_BACKUP_DIR") or os.path.join(
+    os.path.dirname(DB_NAME or ""), "backups"
+)
+DB_BACKUP_INTERVAL = float(os.getenv("DB_BACKUP_INTERVAL") or 86400)
+DB_BACKUP_KEEP = int(os.getenv("DB_BACKUP_KEEP") or 7)
+# The /metrics endpoint is only served when a port is configured
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -24,6 +51,27 @@ intents.members = True
 log = logging.getLogger("UniteBot")
 
 
+class UniteTree(app_commands.CommandTree):
+    """Command tree that times every application command from check to finish."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # Autocomplete runs through the tree too, but is not a command
+        if interaction.type is discord.InteractionType.application_command:
+            interaction.extras["started"] = self.client.metrics.begin()
+        return True
+
+    async def _call(self, interaction: discord.Interaction) -> None:
+        # A command can end marked as failed without raising, which reaches
+        # neither on_error nor on_app_command_completion, so every timed
+        # interaction is finished here however it ends
+        failed = True
+        try:
+            await super()._call(interaction)
+            failed = interaction.command_failed
+        finally:
+            self.client.finish_interaction(interaction, error=failed)
+
+
 class UniteBot(
     commands.Bot,
 ):
@@ -37,14 +85,25 @@ class UniteBot(
             ),
             activity=discord.Activity(type=discord.ActivityType.watching, name="/help"),
             status=discord.Status.do_not_disturb,
+            tree_cls=UniteTree,
         )
         self.logger = log
         self.db = None
+        self.backups = None
+        self.images = ImageValidator()
+        self.metrics = RuntimeMetrics()
+        self.instruments = Instrumentation()
+        self.metricsServer = (
+            MetricsServer(self.render_metrics, host=METRICS_HOST, port=METRICS_PORT)
+            if METRICS_PORT
+            else None
+        )
+        self._guildsSynced = False
 
     async def get_prefix(self, message: discord.Message) -> str:
         """Get the prefix for the specified guild."""
         if not message.guild:
-            return "!"
+            return DEFAULT_PREFIX
 
         prefix = await self.db.guilds.get_prefix(message.guild)
         return prefix
@@ -58,18 +117,37 @@ class UniteBot(
         self.logger.info(f"Using Python Version {platform.python_version()}")
         self.logger.info("-------------------")
         await self.load_database()
+        await self.images.open()
+        self.metrics.start()
+        if self.metricsServer is not None:
+            await self.metricsServer.start()
+            self.logger.info(f"Serving metrics on {METRICS_HOST}:{METRICS_PORT}/metrics")
         await self.load_cogs()
         self.logger.info("UniteBot is ready.")
 
     async def on_ready(self) -> None:
-        for guild in self.guilds:
-            guildID = guild.id
+        # on_ready fires again after every gateway resume, but joins and removals
+        # from then on are tracked by on_guild_join and on_guild_remove
+        if self._guildsSynced:
+            return
+
+        added = await self.db.guilds.sync_guilds(guild.id for guild in self.guilds)
+        self._guildsSynced = True
+        if added:
+            self.logger.info(f"Added {len(added)} missing guild(s) to the database.")
 
-            # Check if the guild is already in the database
-            _guild = await self.db.guilds.get_guild(guildID)
+    async def on_guild_join(self, guild: discord.Guild) -> None:
+        """Executed when the bot joins a guild."""
+        await self.db.guilds.add_guilds([guild.id])
 
-            if _guild is None:
-                await self.db.guilds.add_guild(guildID)
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        """Executed when the bot leaves or is removed from a guild."""
+        await self.db.guilds.remove_guild(guild.id)
+        self.db.assassins.forget_guild(guild.id)
+
+        assassins = self.get_cog("assassin")
+        if assassins is not None:
+            assassins.started.pop(guild.id, None)
 
     async def load_cogs(self):
         for extension in INITIAL_EXTENSIONS:
@@ -81,26 +159,102 @@ class UniteBot(
                 self.logger.error(f"Failed to load extension {extension}\n{exception}")
 
     async def load_database(self):
-        """Connect to the database and create the necessary tables."""
-        self.db = Database(DB_NAME)
-        if self.db is None:
-            self.logger.error("Failed to connect to the database.")
-            return
+        """Connect to the database and migrate it to the current schema."""
+        self.db = Database(
+            DB_NAME,
+            poolSize=DB_POOL_SIZE,
+            wal=DB_WAL,
+            readAfterWrite=DB_READ_AFTER_WRITE,
+            instruments=self.instruments,
+            slowQueryThreshold=DB_SLOW_QUERY_MS and DB_SLOW_QUERY_MS / 1000,
+        )
+        try:
+            await self.db.open()
+        except Exception as e:
+            self.logger.error(f"Failed to connect to the database: {e}")
+            raise
 
         self.logger.info("Connected to the database.")
 
-        await self.db.assassins.create_table()
-        await self.db.guilds.create_table()
+        version = await self.db.migrate()
+        self.logger.info(f"Database schema is at version {version}.")
+        await self.db.guilds.load_prefixes()
+        self.db.assassins.counters.start()
+        if DB_MAINTENANCE_INTERVAL:
+            self.db.maintenance.interval = DB_MAINTENANCE_INTERVAL
+            self.db.maintenance.start()
+
+        self.backups = Backups(
+            self.db, DB_BACKUP_DIR, interval=DB_BACKUP_INTERVAL, keep=DB_BACKUP_KEEP
+        )
+        if DB_BACKUP_INTERVAL:
+            self.backups.start()
 
     async def on_message(self, message: discord.Message) -> None:
         """Executed every time a message is sent in a channel the bot can see."""
         if message.author == self.user or message.author.bot:
             return
+
+        # Drop messages that cannot be commands before any prefix or command lookup
+        if message.guild:
+            prefix = self.db.guilds.cached_prefix(message.guild.id)
+        else:
+            prefix = DEFAULT_PREFIX
+        if prefix is not None and not message.content.startswith(prefix):
+            return
+
         try:
             await self.process_commands(message)
         except Exception as e:
             self.logger.error(f"Error processing message from {message.author}: {e}")
 
+    async def invoke(self, context: Context) -> None:
+        """Invoke a prefix command, recording how long it took."""
+        if context.command is None:
+            await super().invoke(context)
+            return
+
+        start = time.perf_counter()
+        try:
+            await super().invoke(context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.commands.record(elapsed)
+            self.instruments.observe_command(
+                context.command.qualified_name, elapsed, context.command_failed
+            )
+
+    def finish_interaction(
+        self, interaction: discord.Interaction, error: bool = False
+    ) -> None:
+        """Record an application command timed by the command tree as finished."""
+        started = interaction.extras.pop("started", None)
+        if started is None:
+            return
+
+        self.metrics.end(started)
+        command = interaction.command
+        name = f"/{command.qualified_name}" if command else "/unknown"
+        self.instruments.observe_command(name, time.perf_counter() - started, error)
+
+    def render_metrics(self) -> str:
+        """Render the command and query timings plus runtime gauges for Prometheus."""
+        gauges = [
+            "# HELP unite_in_flight_interactions Application commands being handled.",
+            "# TYPE unite_in_flight_interactions gauge",
+            f"unite_in_flight_interactions {self.metrics.inFlight}",
+            "# HELP unite_gateway_latency_seconds Gateway heartbeat latency.",
+            "# TYPE unite_gateway_latency_seconds gauge",
+            f"unite_gateway_latency_seconds {self.latency}",
+            "# HELP unite_db_reads_total Database reads requested.",
+            "# TYPE unite_db_reads_total counter",
+            f"unite_db_reads_total {self.db.reads if self.db else 0}",
+            "# HELP unite_db_coalesced_reads_total Reads that shared an identical in-flight read.",
+            "# TYPE unite_db_coalesced_reads_total counter",
+            f"unite_db_coalesced_reads_total {self.db.coalescedReads if self.db else 0}",
+        ]
+        return self.instruments.render() + "\n".join(gauges) + "\n"
+
     async def on_command_completion(self, context: Context) -> None:
         """Executed when a command is successfully completed."""
         full_command_name = context.command.qualified_name
@@ -126,3 +280,17 @@ class UniteBot(
     async def start(self) -> None:
         """Start the bot."""
         await super().start(TOKEN, reconnect=True)
+
+    async def close(self) -> None:
+        """Close the Discord connection, then the HTTP and database connections."""
+        await super().close()
+        await self.metrics.close()
+        if self.metricsServer is not None:
+            await self.metricsServer.close()
+        await self.images.close()
+        if self.backups is not None:
+            await self.backups.close()
+        if self.db is not None:
+            await self.db.maintenance.close()
+            await self.db.assassins.counters.close()
+            await self.db.close()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import math
 import os
 from typing import TYPE_CHECKING
 
@@ -8,6 +9,7 @@ from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import Context
 from utils.constants import EmbedColors
+from utils.metrics import Histogram
 
 if TYPE_CHECKING:
     from bot import UniteBot
@@ -18,13 +20,47 @@ class Admin(commands.Cog, name="admin"):
     def __init__(self, bot: UniteBot):
         self.bot = bot
 
-    @app_commands.command(name="tps", description="Get the current TPS of the bot.")
+    @staticmethod
+    def format_latency(histogram: Histogram) -> str:
+        """Format a latency histogram's p50/p95/p99 in milliseconds."""
+        percentiles = histogram.percentiles(0.5, 0.95, 0.99)
+        if percentiles[0] is None:
+            return "No samples yet"
+
+        p50, p95, p99 = (value * 1000 for value in percentiles)
+        return f"p50 {p50:.1f}ms · p95 {p95:.1f}ms · p99 {p99:.1f}ms"
+
+    @app_commands.command(name="tps", description="Get the bot's runtime health and latency.")
     async def tps(self, interaction: discord.Interaction):
-        """Get the current TPS of the bot."""
-        embed = discord.Embed(
-            title="TPS",
-            description=f"The current TPS of the bot is 20.0.",
-            color=discord.Color.green(),
+        """Get the bot's runtime health and latency."""
+        metrics = self.bot.metrics
+        gateway = self.bot.latency
+        embed = discord.Embed(title="Bot Health", color=discord.Color.green())
+        embed.add_field(
+            name="Event Loop Lag",
+            value=self.format_latency(metrics.loopLag),
+            inline=False,
+        )
+        embed.add_field(
+            name="Gateway Latency",
+            value=f"{gateway * 1000:.1f}ms" if math.isfinite(gateway) else "Not connected",
+            inline=False,
+        )
+        embed.add_field(
+            name="Database Latency",
+            value=self.format_latency(self.bot.db.latency),
+            inline=False,
+        )
+        embed.add_field(
+            name="Command Latency",
+            value=self.format_latency(metrics.commands),
+            inline=False,
+        )
+        embed.add_field(name="In-Flight Interactions", value=str(metrics.inFlight))
+        db = self.bot.db
+        embed.add_field(
+            name="Coalesced Reads",
+            value=f"{db.coalescedReads}/{db.reads} ({db.coalescedReads / max(db.reads, 1):.1%})",
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 import re
 
 import discord
@@ -10,7 +10,7 @@ from discord.ext import commands
 from discord.ext.commands import Context
 from utils.context import ConfirmationView
 from utils.constants import EmbedColors
-from utils.utils import validImageURL
+from utils.announcements import Announcer
 from database.assassins import PlayerStatus
 
 if TYPE_CHECKING:
@@ -23,24 +23,19 @@ class Assassins(commands.Cog, name="assassin"):
         self.bot = bot
         self.db = bot.db
         self.started = {}
+        self.announcer = Announcer(bot)
 
     async def cog_load(self):
-        guilds = await self.db.guilds.get_all_guilds()
-        for guild in guilds:
+        async for guild in self.db.guilds.iter_all_guilds():
             self.started[guild.guildID] = guild.assassinsStarted
 
+    async def cog_unload(self):
+        await self.announcer.close()
+
     @commands.Cog.listener()
-    async def on_player_dead(self, user: discord.Member):
+    async def on_player_dead(self, guild: discord.Guild, playerID: int, name: str):
         """Announce when a player is eliminated."""
-        player = await self.db.assassins.get_player_by_discord_id(user)
-        channelID = await self.db.guilds.get_channel(user.guild, "assassins")
-        embed = discord.Embed(
-            title="Assassins Announcement",
-            description=f"{player.name ({user.mention})} has been eliminated.",
-            color=EmbedColors.RED,
-        )
-
-        await self.bot.get_channel(channelID).send(embed=embed)
+        self.announcer.announce(guild, f"{name} (<@{playerID}>) has been eliminated.")
 
     @app_commands.command(
         name="register", description="Create and link your Assassin profile."
@@ -54,16 +49,6 @@ class Assassins(commands.Cog, name="assassin"):
         self, interaction: discord.Interaction, name: str, email: str, photo_url: str
     ):
         """Register for the Assassin game."""
-        # Check if the user has already registered
-        if await self.db.assassins.get_player_by_discord_id(interaction.user):
-            embed = discord.Embed(
-                title="Register",
-                description="You have already registered.",
-                color=EmbedColors.RED,
-            )
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
-
         # Validate Name
         if not name or not re.match(r"^[a-zA-Z\s]+$", name):
             embed = discord.Embed(
@@ -85,7 +70,7 @@ class Assassins(commands.Cog, name="assassin"):
             return
 
         # Validate URL
-        if not await validImageURL(photo_url):
+        if not await self.bot.images.validate(photo_url):
             embed = discord.Embed(
                 title="Register",
                 description="The Photo URL provided is not a valid image. Please provide a valid link to your profile photo.",
@@ -94,8 +79,20 @@ class Assassins(commands.Cog, name="assassin"):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        # Register the player
-        await self.db.assassins.add_player(name, email, interaction.user, photo_url)
+        # Register the player, unless they or their email already are
+        player, created = await self.db.assassins.add_player(
+            interaction.guild, name, email, interaction.user, photo_url
+        )
+        if not created:
+            if player.discordID == interaction.user.id:
+                description = "You have already registered."
+            else:
+                description = "That email is already registered to another player."
+            embed = discord.Embed(
+                title="Register", description=description, color=EmbedColors.RED
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
 
         embed = discord.Embed(
             title="Register",
@@ -110,7 +107,9 @@ class Assassins(commands.Cog, name="assassin"):
     async def unregister(self, interaction: discord.Interaction):
         """Unregister from the Assassin game."""
         # Check if the user has already registered
-        if not await self.db.assassins.get_player_by_discord_id(interaction.user):
+        if not await self.db.assassins.get_player_by_discord_id(
+            interaction.guild, interaction.user
+        ):
             embed = discord.Embed(
                 title="Unregister",
                 description="You have not registered.",
@@ -136,7 +135,9 @@ class Assassins(commands.Cog, name="assassin"):
 
         # If the user confirms, unregister them
         if confirm.value:
-            await self.db.assassins.delete_player_by_discord_id(interaction.user)
+            await self.db.assassins.delete_player_by_discord_id(
+                interaction.guild, interaction.user
+            )
             embed = discord.Embed(
                 title="Unregister",
                 description="Successfully unregistered from the Assassins game.",
@@ -144,32 +145,33 @@ class Assassins(commands.Cog, name="assassin"):
             )
             await (await interaction.original_response()).edit(embed=embed, view=None)
 
+            # Deleting a player in a running game can leave one player standing
+            if self.started.get(interaction.guild.id, False):
+                await self.end_game_if_won(interaction.guild)
+
     @app_commands.command(name="join", description="Join the Assassins game.")
     async def join(self, interaction: discord.Interaction):
         """Join the Assassin game."""
-        # Check if the user has already registered
-        player = await self.db.assassins.get_player_by_discord_id(interaction.user)
-        if not player:
+        # If the game has started, the player has to wait for the next one
+        if self.started.get(interaction.guild.id, False):
             embed = discord.Embed(
                 title="Join",
-                description="You are not a registered player. Please use the /register command first.",
+                description="The game has already started. Please wait for the game to end before joining.",
                 color=EmbedColors.RED,
             )
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        # If the game has started, set the player status to spectator
-        if self.started:
+        # If the game has not started, set the player status to alive
+        if not await self.db.assassins.join_game(interaction.guild, interaction.user):
             embed = discord.Embed(
                 title="Join",
-                description="The game has already started. Please wait for the game to end before joining.",
+                description="You are not a registered player. Please use the /register command first.",
                 color=EmbedColors.RED,
             )
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        # If the game has not started, set the player status to alive
-        await self.db.assassins.set_player_status(interaction.user, PlayerStatus.ALIVE)
         embed = discord.Embed(
             title="Join",
             description="Successfully joined the Assassins game. The game will start soon.",
@@ -180,8 +182,16 @@ class Assassins(commands.Cog, name="assassin"):
     @app_commands.command(name="leave", description="Leave the Assassins game.")
     async def leave(self, interaction: discord.Interaction):
         """Leave the Assassin game."""
-        # Check if the user has already registered
-        player = await self.db.assassins.get_player_by_discord_id(interaction.user)
+        started = self.started.get(interaction.guild.id, False)
+        if started:
+            player = await self.db.assassins.get_player_by_discord_id(
+                interaction.guild, interaction.user
+            )
+        else:
+            # Before the game starts, an alive player is returned to spectating
+            player = await self.db.assassins.leave_game(
+                interaction.guild, interaction.user
+            )
         if not player:
             embed = discord.Embed(
                 title="Leave",
@@ -193,8 +203,8 @@ class Assassins(commands.Cog, name="assassin"):
 
         # If the user is dead, they cannot leave the game
         if (
-            player.status == PlayerStatus.DEAD
-            or player.status == PlayerStatus.SPECTATOR
+            player.status == PlayerStatus.DEAD.value
+            or player.status == PlayerStatus.SPECTATOR.value
         ):
             embed = discord.Embed(
                 title="Leave",
@@ -204,11 +214,8 @@ class Assassins(commands.Cog, name="assassin"):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        # If game has not started, set the player status to spectator
-        if not self.started:
-            await self.db.assassins.set_player_status(
-                interaction.user, PlayerStatus.SPECTATOR
-            )
+        # If game has not started, the player is already back to spectating
+        if not started:
             embed = discord.Embed(
                 title="Leave",
                 description="Successfully left the Assassins game.",
@@ -234,9 +241,18 @@ class Assassins(commands.Cog, name="assassin"):
 
         # If the user confirms, set their status to dead
         if confirm.value:
-            await self.db.assassins.set_player_status(
-                interaction.user, PlayerStatus.DEAD
-            )
+            # The player may have been eliminated while they were deciding
+            if not await self.db.assassins.forfeit_player(
+                interaction.guild, interaction.user
+            ):
+                embed = discord.Embed(
+                    title="Leave",
+                    description="You are already dead and cannot leave the game.",
+                    color=EmbedColors.RED,
+                )
+                await (await interaction.original_response()).edit(embed=embed)
+                return
+
             embed = discord.Embed(
                 title="Leave",
                 description="You have forfeitted the current game and now declared dead.",
@@ -245,12 +261,14 @@ class Assassins(commands.Cog, name="assassin"):
             await (await interaction.original_response()).edit(embed=embed)
 
             # Announce the player's death
-            embed = discord.Embed(
-                title="Assassins Announcement",
-                description=f"{player.name} has forfeitted the game and is now dead.",
-                color=EmbedColors.PRIMARY,
+            self.announcer.announce(
+                interaction.guild,
+                f"{player.name} ({interaction.user.mention}) has forfeitted the game and is now dead.",
             )
 
+            # A forfeit can leave a single player standing
+            await self.end_game_if_won(interaction.guild)
+
     @app_commands.command(name="start", description="Start the Assassins game.")
     async def start(self, interaction: discord.Interaction):
         """Start the Assassin game."""
@@ -276,8 +294,44 @@ class Assassins(commands.Cog, name="assassin"):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
+        # Players who have since left the server sit this game out
+        playerIDs = await self.db.assassins.get_player_ids_by_status(
+            interaction.guild, PlayerStatus.ALIVE
+        )
+        departed = [
+            playerID
+            for playerID in playerIDs
+            if interaction.guild.get_member(playerID) is None
+        ]
+        if departed:
+            await self.db.assassins.set_players_status(
+                interaction.guild, departed, PlayerStatus.SPECTATOR
+            )
+
+        if len(playerIDs) - len(departed) < 2:
+            embed = discord.Embed(
+                title="Start",
+                description="At least two players must join before the game can start.",
+                color=EmbedColors.RED,
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        # Claim the start straight away so a second /start is turned away, but
+        # only record the game as started once every player has a target
         self.started[guildID] = True
-        await self.db.assassins.set_game_state(guildID, True)
+        try:
+            # Seeding the shuffle with the interaction ID makes every ring reproducible
+            count = await self.db.assassins.assign_targets(
+                interaction.guild, seed=interaction.id
+            )
+            await self.db.assassins.set_game_state(guildID, True)
+        except Exception:
+            self.started[guildID] = False
+            raise
+        self.bot.logger.info(
+            f"Assigned targets for {count} players in {interaction.guild.name} (ID: {guildID}) with seed {interaction.id}"
+        )
 
         embed = discord.Embed(
             title="Assassins Game Started!",
@@ -306,15 +360,7 @@ class Assassins(commands.Cog, name="assassin"):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        self.started[guildID] = False
-        await self.db.assassins.set_game_state(guildID, False)
-
-        # Assign all players to spectators
-        players = await self.db.assassins.get_all_players()
-        for player in players:
-            await self.db.assassins.set_player_status(
-                interaction.guild.get_member(player.discordID), PlayerStatus.SPECTATOR
-            )
+        await self.end_game(interaction.guild)
 
         # Send the announcement with @everyone mention
         embed = discord.Embed(
@@ -328,12 +374,184 @@ class Assassins(commands.Cog, name="assassin"):
             allowed_mentions=discord.AllowedMentions(everyone=True),
         )
 
+    async def end_game(self, guild: discord.Guild, winnerID: int = None) -> None:
+        """End the guild's game, crowning the winner if there is one."""
+        self.started[guild.id] = False
+        await self.db.assassins.set_game_state(guild.id, False)
+
+        # Count the game for everyone in it and return them to spectating
+        await self.db.assassins.finish_game(guild)
+
+        if winnerID is None:
+            return
+
+        winner = guild.get_member(winnerID) or discord.Object(id=winnerID)
+        await self.db.assassins.add_win(guild, winner)
+
+        channelID = await self.db.guilds.get_channel(guild, "assassins")
+        channel = self.bot.get_channel(channelID) if channelID else None
+        if channel is not None:
+            embed = discord.Embed(
+                title="Assassins Game Won!",
+                description=f"<@{winnerID}> is the last assassin standing and has won the game!",
+                color=EmbedColors.GREEN,
+            )
+            await channel.send(
+                content="@everyone",
+                embed=embed,
+                allowed_mentions=discord.AllowedMentions(everyone=True),
+            )
+
+    async def end_game_if_won(self, guild: discord.Guild) -> None:
+        """End the guild's game if a single player is left alive."""
+        alive = await self.db.assassins.get_player_ids_by_status(
+            guild, PlayerStatus.ALIVE
+        )
+        if len(alive) == 1:
+            await self.end_game(guild, winnerID=alive[0])
+
+    @app_commands.command(name="target", description="See who your current target is.")
+    async def target(self, interaction: discord.Interaction):
+        """See who your current target is."""
+        target = await self.db.assassins.get_target(interaction.guild, interaction.user)
+        if not target:
+            embed = discord.Embed(
+                title="Target",
+                description="You do not have a target. Join the game and wait for it to start.",
+                color=EmbedColors.RED,
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        embed = discord.Embed(
+            title="Your Target",
+            description=f"**{target.name}** (<@{target.discordID}>)",
+            color=EmbedColors.PRIMARY,
+        )
+        if target.photoURL:
+            embed.set_thumbnail(url=target.photoURL)
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(
+        name="eliminate", description="Report that you have eliminated your target."
+    )
+    async def eliminate(self, interaction: discord.Interaction):
+        """Report that you have eliminated your target."""
+        target = await self.db.assassins.get_target(interaction.guild, interaction.user)
+        if not target or not self.started.get(interaction.guild.id, False):
+            embed = discord.Embed(
+                title="Eliminate",
+                description="You do not have a target to eliminate.",
+                color=EmbedColors.RED,
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        # Confirm the elimination before removing the target from the game
+        embed = discord.Embed(
+            title="Are You Sure?",
+            description=f"Confirm that you have eliminated **{target.name}**.",
+            color=EmbedColors.PRIMARY,
+        )
+        confirm = ConfirmationView(
+            timeout=60.0, authorID=interaction.user.id, delete_after=False
+        )
+        await interaction.response.send_message(
+            embed=embed, view=confirm, ephemeral=True
+        )
+        confirm.message = await interaction.original_response()
+        await confirm.wait()
+
+        if not confirm.value:
+            return
+
+        result = await self.db.assassins.eliminate_target(
+            interaction.guild, interaction.user, targetID=target.discordID
+        )
+        if result is None:
+            embed = discord.Embed(
+                title="Eliminate",
+                description="Your target changed before the elimination was recorded.",
+                color=EmbedColors.RED,
+            )
+            await (await interaction.original_response()).edit(embed=embed, view=None)
+            return
+
+        victimID, nextID = result
+        embed = discord.Embed(
+            title="Eliminate",
+            description=f"You have eliminated **{target.name}**. Use /target to see your next target.",
+            color=EmbedColors.GREEN,
+        )
+        await (await interaction.original_response()).edit(embed=embed, view=None)
+
+        self.bot.dispatch("player_dead", interaction.guild, victimID, target.name)
+
+        if nextID is None:
+            await self.end_game(interaction.guild, winnerID=interaction.user.id)
+
+    @app_commands.command(
+        name="leaderboard", description="View the server's top Assassins."
+    )
+    async def leaderboard(self, interaction: discord.Interaction):
+        """View the server's top Assassins."""
+        players = await self.db.assassins.get_leaderboard(interaction.guild, limit=25)
+        if not players:
+            embed = discord.Embed(
+                title="Leaderboard",
+                description="No one has registered for the Assassins game yet.",
+                color=EmbedColors.RED,
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        lines = [
+            f"**{position}.** {name} (<@{discordID}>) - {wins} Wins, {kills} Kills"
+            for position, (discordID, name, wins, kills) in enumerate(players, 1)
+        ]
+        embed = discord.Embed(
+            title="Assassins Leaderboard",
+            description="\n".join(lines),
+            color=EmbedColors.PRIMARY,
+        )
+        await interaction.response.send_message(
+            embed=embed, allowed_mentions=discord.AllowedMentions.none()
+        )
+
+    @app_commands.command(name="rank", description="View an Assassin's rank.")
+    @app_commands.describe(target="Discord User")
+    async def rank(
+        self, interaction: discord.Interaction, target: Optional[discord.Member] = None
+    ):
+        """View an Assassin's rank."""
+        target = target or interaction.user
+        rank = await self.db.assassins.get_rank(interaction.guild, target)
+        if not rank:
+            embed = discord.Embed(
+                title="Rank",
+                description="This user has not registered for the Assassins game.",
+                color=EmbedColors.RED,
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        position, total = rank
+        embed = discord.Embed(
+            title="Rank",
+            description=f"{target.mention} is ranked **#{position}** of {total} Assassins.",
+            color=EmbedColors.PRIMARY,
+        )
+        await interaction.response.send_message(embed=embed)
+
     @app_commands.command(name="profile", description="View an Assassin's profile.")
     @app_commands.describe(target="Discord User")
     async def profile(self, interaction: discord.Interaction, target: discord.Member):
         """View an Assassin's profile."""
         # Get the player's profile
-        player = await self.db.assassins.get_player_by_discord_id(target)
+        player = await self.db.assassins.get_player_by_discord_id(
+            interaction.guild, target
+        )
         if not player:
             embed = discord.Embed(
                 title="Profile",
@@ -346,7 +564,7 @@ class Assassins(commands.Cog, name="assassin"):
         # Create the profile embed
         embed = discord.Embed(
             title=f"{player.name}'s Profile",
-            description=f"**Status:** {player.status}\n**Kills:** {player.kills}\n**Deaths:** {player.deaths}\n**Wins:** {player.wins}\n**Games Played:** {player.gamesPlayed}",
+            description=f"**Status:** {PlayerStatus(player.status).name.title()}\n**Kills:** {player.kills}\n**Deaths:** {player.deaths}\n**Wins:** {player.wins}\n**Games Played:** {player.gamesPlayed}",
             color=EmbedColors.PRIMARY,
         )
         try:
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import time
 from typing import TYPE_CHECKING, Optional
 import discord
 from discord import app_commands
@@ -80,6 +81,119 @@ class Owner(commands.Cog, name="owner"):
             )
             await ctx.send(embed=embed)
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def metrics(self, ctx: Context, count: int = 5):
+        """Show the commands and queries that took the most time in total."""
+        instruments = self.bot.instruments
+        embed = discord.Embed(title="Metrics", color=discord.Color.green())
+        for name, timings in (
+            ("Commands", instruments.commands),
+            ("Queries", instruments.queries),
+        ):
+            lines = [
+                f"`{label[:80]}`\n{timing.count} calls · "
+                f"avg {timing.sum / timing.count * 1000:.1f}ms · {timing.errors} errors"
+                for label, timing in instruments.top(timings, count)
+            ]
+            embed.add_field(
+                name=f"Top {name} by Total Time",
+                value="\n".join(lines)[:1024] or "No samples yet",
+                inline=False,
+            )
+        await ctx.send(embed=embed)
+
+    @staticmethod
+    def format_size(size: int) -> str:
+        """Format a size in bytes for display."""
+        for unit in ("B", "KiB", "MiB"):
+            if size < 1024:
+                return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GiB"
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def dbstats(self, ctx: Context, run: bool = False):
+        """Show the database's file, free list and WAL sizes, optionally after maintenance."""
+        maintenance = self.bot.db.maintenance
+        description = None
+        if run:
+            done = await maintenance.run()
+            description = f"Ran maintenance: {', '.join(done) or 'nothing'}."
+
+        stats = await maintenance.stats()
+        embed = discord.Embed(
+            title="Database", description=description, color=discord.Color.green()
+        )
+        embed.add_field(name="File", value=self.format_size(stats["fileSize"]))
+        embed.add_field(name="Free List", value=self.format_size(stats["freelistSize"]))
+        embed.add_field(name="WAL", value=self.format_size(stats["walSize"]))
+        embed.add_field(
+            name="Incremental Vacuum",
+            value="Enabled" if stats["autoVacuum"] == 2 else "Disabled (needs a VACUUM)",
+        )
+        embed.add_field(
+            name="Planner Statistics", value="Gathered" if stats["analyzed"] else "Missing"
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def backup(self, ctx: Context):
+        """Back the database up now."""
+        started = time.perf_counter()
+        try:
+            path = await self.bot.backups.backup()
+        except Exception as e:
+            embed = discord.Embed(
+                title="Backup",
+                description=f"Failed to back up the database\n{e}",
+                color=discord.Color.red(),
+            )
+            await ctx.send(embed=embed)
+            return
+
+        embed = discord.Embed(
+            title="Backup",
+            description=f"Backed up the database to `{os.path.basename(path)}` "
+            f"({self.format_size(os.path.getsize(path))}) in {time.perf_counter() - started:.2f}s.",
+            color=discord.Color.green(),
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def verifybackup(self, ctx: Context, name: Optional[str] = None):
+        """Run an integrity check on a backup, the newest by default."""
+        backups = self.bot.backups
+        path = os.path.join(backups.directory, os.path.basename(name)) if name else None
+        try:
+            path, problems = await backups.verify(path)
+        except Exception as e:
+            embed = discord.Embed(
+                title="Verify Backup",
+                description=f"Failed to check the backup\n{e}",
+                color=discord.Color.red(),
+            )
+            await ctx.send(embed=embed)
+            return
+
+        name = os.path.basename(path)
+        if problems == ["ok"]:
+            embed = discord.Embed(
+                title="Verify Backup",
+                description=f"`{name}` passed its integrity check.",
+                color=discord.Color.green(),
+            )
+        else:
+            embed = discord.Embed(
+                title="Verify Backup",
+                description=f"`{name}` failed its integrity check\n" + "\n".join(problems)[:3900],
+                color=discord.Color.red(),
+            )
+        await ctx.send(embed=embed)
+
     @commands.group(invoke_without_command=True)
     @commands.is_owner()
     @commands.guild_only()
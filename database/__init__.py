@@ -1,6 +1,9 @@
 from .database import Database as DB
 from .assassins import Assassins
 from .guilds import Guilds
+from .maintenance import Maintenance
+from .migrations import migrate
+from .records import Player, Guild
 
 
 class Database(DB):
@@ -9,3 +12,8 @@ class Database(DB):
 
         self.assassins = Assassins(self)
         self.guilds = Guilds(self)
+        self.maintenance = Maintenance(self)
+
+    async def migrate(self) -> int:
+        """Bring the schema up to date and return its version."""
+        return await migrate(self)
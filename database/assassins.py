@@ -1,118 +1,487 @@
+import logging
+import random
 from enum import Enum
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+import aiosqlite
 import discord
-from database.database import Database
+from database.cache import MISS, PlayerCache
+from database.database import BATCH_SIZE, Database
+from database.records import Player
+from database.counters import StatCounters
+from database.leaderboard import Leaderboard
 
 TABLE_NAME = "assassins"
 
+# Hands a player's target to whoever is hunting them. A hunter who would be left
+# targeting themselves is the last player standing and gets no target.
+SPLICE_QUERY = f"""UPDATE {TABLE_NAME} SET targetID = NULLIF((
+        SELECT targetID FROM {TABLE_NAME} WHERE guildID = ? AND discordID = ?
+    ), discordID) WHERE guildID = ? AND targetID = ?;
+    """
+
+log = logging.getLogger(__name__)
+
 
 class PlayerStatus(Enum):
-    SPECTATOR = "Spectator"
-    ALIVE = "Alive"
-    DEAD = "Dead"
+    """A player's part in the guild's game, stored as its integer value."""
+
+    SPECTATOR = 0
+    ALIVE = 1
+    DEAD = 2
 
 
 class Assassins:
     def __init__(self, db: Database):
         self._db = db
         self.status = PlayerStatus
-
-    async def create_table(self) -> None:
-        conn = await self._db.connect()
-        query = f"""
-            CREATE TABLE IF NOT EXISTS assassins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                discordID INTEGER NOT NULL UNIQUE,
-                photoURL TEXT,
-                wins INTEGER DEFAULT 0,
-                kills INTEGER DEFAULT 0,
-                deaths INTEGER DEFAULT 0,
-                gamesPlayed INTEGER DEFAULT 0,
-                status TEXT NOT NULL DEFAULT 'Spectator'
-            );
-            """
-
-        await self._db.run(
-            query,
-            conn=conn,
-        )
-        await conn.close()
+        self.leaderboard = Leaderboard()
+        # Kills, deaths and wins are written behind; reads merge what is pending
+        self.counters = StatCounters(db, TABLE_NAME, onFlush=self._stats_flushed)
+        # Player rows as stored, before pending stat changes are merged in
+        self.cache = PlayerCache()
 
     async def set_game_state(self, guildID: int, state: bool):
         """Set the current Guild's Assassins game state."""
-        conn = await self._db.connect()
         await self._db.run(
             f"UPDATE guilds SET assassinsStarted = ? WHERE guildID = ?;",
             (state, guildID),
-            conn=conn,
         )
-        await conn.close()
 
     async def add_player(
-        self, name: str, email: str, discordID: discord.Member, photoURL: str
-    ):
-        """Add a player to the database."""
-        conn = await self._db.connect()
-
-        # Check if the player already exists
-        player = await self.get_player_by_discord_id(discordID)
-
-        if player is None:
-            await self._db.run(
-                f"""INSERT INTO {TABLE_NAME} (name, email, discordID, photoURL, status)
-                VALUES (?, ?, ?, ?, ?);
-                """,
-                (name, email, discordID.id, photoURL, self.status.SPECTATOR.value),
-                conn=conn,
+        self,
+        guild: discord.Guild,
+        name: str,
+        email: str,
+        discordID: discord.Member,
+        photoURL: str,
+    ) -> Tuple[Player, bool]:
+        """Register a player in the guild in a single transaction.
+
+        Returns the new player and True. If the member or the email is already
+        registered in the guild, nothing changes and that player is returned
+        with False instead.
+        """
+        async with self.counters.reading():
+            async with self._db.transaction() as tx:
+                player = await tx.execute(
+                    f"""INSERT INTO {TABLE_NAME} (guildID, name, email, discordID, photoURL, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT DO NOTHING
+                    RETURNING *;
+                    """,
+                    (
+                        guild.id,
+                        name,
+                        email,
+                        discordID.id,
+                        photoURL,
+                        self.status.SPECTATOR.value,
+                    ),
+                    fetch="one",
+                    record=Player,
+                )
+                created = player is not None
+                if not created:
+                    # Prefer the member's own registration over an email clash
+                    player = await tx.execute(
+                        f"""SELECT * FROM {TABLE_NAME}
+                        WHERE guildID = ? AND (discordID = ? OR email = ?)
+                        ORDER BY discordID = ? DESC LIMIT 1;
+                        """,
+                        (guild.id, discordID.id, email, discordID.id),
+                        fetch="one",
+                        record=Player,
+                    )
+            self.counters.merge(player)
+
+        self.cache.invalidate(guild.id, discordID.id, email)
+        if created:
+            self.leaderboard.update(guild.id, discordID.id, name, player.wins, player.kills)
+        return player, created
+
+    async def join_game(
+        self, guild: discord.Guild, player: discord.Member
+    ) -> Optional[Player]:
+        """Add a registered player to the guild's next game.
+
+        Returns the joined player, or None if they are not registered.
+        """
+        async with self.counters.reading():
+            result = await self._db.execute(
+                f"UPDATE {TABLE_NAME} SET status = ? WHERE guildID = ? AND discordID = ? RETURNING *;",
+                (PlayerStatus.ALIVE.value, guild.id, player.id),
+                fetch="one",
+                commit=True,
+                record=Player,
             )
+            if result:
+                self.counters.merge(result)
+
+        self.cache.invalidate(guild.id, player.id)
+        return result
+
+    async def leave_game(
+        self, guild: discord.Guild, player: discord.Member
+    ) -> Optional[Player]:
+        """Return a player who joined the guild's next game to spectating.
+
+        Only an alive player is changed. Returns the player as they were
+        before leaving, or None if they are not registered.
+        """
+        async with self.counters.reading():
+            async with self._db.transaction() as tx:
+                result = await tx.execute(
+                    f"SELECT * FROM {TABLE_NAME} WHERE guildID = ? AND discordID = ?;",
+                    (guild.id, player.id),
+                    fetch="one",
+                    record=Player,
+                )
+                if result and result.status == PlayerStatus.ALIVE.value:
+                    await tx.execute(
+                        f"UPDATE {TABLE_NAME} SET status = ? WHERE guildID = ? AND discordID = ?;",
+                        (PlayerStatus.SPECTATOR.value, guild.id, player.id),
+                    )
+            if result:
+                self.counters.merge(result)
 
-        await conn.close()
+        self.cache.invalidate(guild.id, player.id)
+        return result
 
-    async def set_player_status(self, discordID: discord.Member, status: PlayerStatus):
+    async def set_player_status(
+        self, guild: discord.Guild, discordID: discord.Member, status: PlayerStatus
+    ):
         """Set a player's game status."""
-        conn = await self._db.connect()
         await self._db.run(
-            f"UPDATE {TABLE_NAME} SET status = ? WHERE discordID = ?;",
-            (status.value, discordID.id),
+            f"UPDATE {TABLE_NAME} SET status = ? WHERE guildID = ? AND discordID = ?;",
+            (status.value, guild.id, discordID.id),
         )
-        await conn.close()
+        self.cache.invalidate(guild.id, discordID.id)
 
-    async def get_player_by_discord_id(self, player: discord.Member):
-        """Get a player by their discord ID."""
-        player = await self._db.execute(
-            f"SELECT * FROM {TABLE_NAME} WHERE discordID = ?;",
-            (player.id,),
-            fetch="one",
+    async def set_players_status(
+        self, guild: discord.Guild, discordIDs: Iterable[int], status: PlayerStatus
+    ) -> None:
+        """Set the game status of several players in a single transaction."""
+        await self._db.run_many(
+            f"UPDATE {TABLE_NAME} SET status = ? WHERE guildID = ? AND discordID = ?;",
+            ((status.value, guild.id, discordID) for discordID in discordIDs),
         )
+        self.cache.invalidate_guild(guild.id)
 
-        return player
+    async def get_player_by_discord_id(
+        self, guild: discord.Guild, player: discord.Member
+    ):
+        """Get a player by their discord ID, or None if they are not registered."""
+        cached = self.cache.get(guild.id, player.id)
+        if cached is not MISS:
+            if cached:
+                self.counters.merge(cached)
+            return cached
 
-    async def get_player_by_email(self, email: str):
-        """Get a player by their email."""
-        player = await self._db.execute(
-            f"SELECT * FROM {TABLE_NAME} WHERE email = ?;",
-            (email,),
-            fetch="one",
-        )
+        async with self.counters.reading():
+            version = self.cache.version()
+            result = await self._db.execute(
+                f"SELECT * FROM {TABLE_NAME} WHERE guildID = ? AND discordID = ?;",
+                (guild.id, player.id),
+                fetch="one",
+                record=Player,
+            )
+            self.cache.put(guild.id, player.id, result, version)
+            if result:
+                self.counters.merge(result)
 
-        return player
+        return result
 
-    async def get_all_players(self):
-        """Get all players from the database."""
-        players = await self._db.execute(
-            f"SELECT * FROM {TABLE_NAME};",
+    async def get_player_ids_by_status(
+        self, guild: discord.Guild, status: PlayerStatus
+    ) -> List[int]:
+        """Get the discord IDs of every player in the guild with the given status."""
+        rows = await self._db.execute(
+            f"SELECT discordID FROM {TABLE_NAME} WHERE guildID = ? AND status = ?;",
+            (guild.id, status.value),
             fetch="all",
+            raw=True,
         )
 
+        return [row[0] for row in rows or ()]
+
+    async def get_player_by_email(self, guild: discord.Guild, email: str):
+        """Get a player by their email, or None if no one registered with it."""
+        cached = self.cache.get_by_email(guild.id, email)
+        if cached is not MISS:
+            if cached:
+                self.counters.merge(cached)
+            return cached
+
+        async with self.counters.reading():
+            version = self.cache.version()
+            player = await self._db.execute(
+                f"SELECT * FROM {TABLE_NAME} WHERE guildID = ? AND email = ?;",
+                (guild.id, email),
+                fetch="one",
+                record=Player,
+            )
+            self.cache.put_by_email(guild.id, email, player, version)
+            if player:
+                self.counters.merge(player)
+
+        return player
+
+    async def get_all_players(self, guild: discord.Guild):
+        """Get all of the guild's players from the database."""
+        async with self.counters.reading():
+            players = await self._db.execute(
+                f"SELECT * FROM {TABLE_NAME} WHERE guildID = ?;",
+                (guild.id,),
+                fetch="all",
+                record=Player,
+            )
+            for player in players or ():
+                self.counters.merge(player)
+
         return players
 
-    async def delete_player_by_discord_id(self, player: discord.Member):
-        """Delete a player by their discord ID."""
-        conn = await self._db.connect()
-        await self._db.run(
-            f"DELETE FROM {TABLE_NAME} WHERE discordID = ?;",
-            (player.id,),
-            conn=conn,
+    async def iter_all_players(
+        self, guild: discord.Guild, batch_size: int = BATCH_SIZE
+    ) -> AsyncIterator[Player]:
+        """Stream the guild's players, `batch_size` rows at a time.
+
+        Pending stat changes are merged from a snapshot taken as the query
+        starts, so stat counters keep flushing while the stream is open.
+        """
+        rows = self._db.iterate(
+            f"SELECT * FROM {TABLE_NAME} WHERE guildID = ?;",
+            (guild.id,),
+            batch_size=batch_size,
+            record=Player,
         )
-        await conn.close()
+        try:
+            # Once the query has started, its rows see no later flush, so they
+            # pair with the changes pending at that moment
+            async with self.counters.reading():
+                snapshot = self.counters.snapshot(guild.id)
+                player = await anext(rows, None)
+
+            while player is not None:
+                self.counters.merge(player, snapshot)
+                yield player
+                player = await anext(rows, None)
+        finally:
+            await rows.aclose()
+
+    async def delete_player_by_discord_id(
+        self, guild: discord.Guild, player: discord.Member
+    ):
+        """Delete a player by their discord ID, closing the target ring around them."""
+        await self._db.run_atomic(
+            [
+                (SPLICE_QUERY, (guild.id, player.id, guild.id, player.id)),
+                (
+                    f"DELETE FROM {TABLE_NAME} WHERE guildID = ? AND discordID = ?;",
+                    (guild.id, player.id),
+                ),
+            ]
+        )
+        # Closing the ring changed whoever was hunting the player too
+        self.cache.invalidate_guild(guild.id)
+        self.counters.discard(guild.id, player.id)
+        self.leaderboard.remove(guild.id, player.id)
+
+    def forget_guild(self, guildID: int) -> None:
+        """Drop the cached players and leaderboard of a guild the bot has left.
+
+        The players stay in the database, and their pending stat changes are
+        still written, in case the bot is invited back.
+        """
+        self.cache.invalidate_guild(guildID)
+        self.leaderboard.drop(guildID)
+
+    async def assign_targets(self, guild: discord.Guild, seed: int) -> int:
+        """Shuffle the guild's alive players into a target ring.
+
+        The same seed and players always produce the same ring. Returns the
+        number of players in the ring.
+        """
+        playerIDs = sorted(await self.get_player_ids_by_status(guild, PlayerStatus.ALIVE))
+        random.Random(seed).shuffle(playerIDs)
+        ring = [
+            (target, guild.id, hunter)
+            for hunter, target in zip(playerIDs, playerIDs[1:] + playerIDs[:1])
+        ]
+
+        async def work(conn: aiosqlite.Connection) -> None:
+            await conn.execute(
+                f"UPDATE {TABLE_NAME} SET targetID = NULL WHERE guildID = ? AND targetID IS NOT NULL;",
+                (guild.id,),
+            )
+            await conn.executemany(
+                f"UPDATE {TABLE_NAME} SET targetID = ? WHERE guildID = ? AND discordID = ?;",
+                ring,
+            )
+
+        await self._db.run_unit(work)
+        self.cache.invalidate_guild(guild.id)
+        return len(ring)
+
+    async def finish_game(self, guild: discord.Guild) -> None:
+        """Count a game played for everyone in it and return them to spectating.
+
+        Also removes the guild's target ring. Games played are written behind
+        like the other stats.
+        """
+        rows = await self._db.execute(
+            f"""UPDATE {TABLE_NAME} SET status = ?, targetID = NULL
+            WHERE guildID = ? AND status != ?
+            RETURNING discordID;
+            """,
+            (PlayerStatus.SPECTATOR.value, guild.id, PlayerStatus.SPECTATOR.value),
+            fetch="all",
+            commit=True,
+            raw=True,
+        )
+        self.cache.invalidate_guild(guild.id)
+        for (discordID,) in rows or ():
+            self.counters.increment(guild.id, discordID, gamesPlayed=1)
+
+    async def get_target(self, guild: discord.Guild, player: discord.Member):
+        """Get the player that the given player has to eliminate."""
+        target = await self._db.execute(
+            f"""SELECT target.* FROM {TABLE_NAME} AS hunter
+            JOIN {TABLE_NAME} AS target
+                ON target.guildID = hunter.guildID AND target.discordID = hunter.targetID
+            WHERE hunter.guildID = ? AND hunter.discordID = ?;
+            """,
+            (guild.id, player.id),
+            fetch="one",
+            record=Player,
+        )
+
+        return target
+
+    async def eliminate_target(
+        self, guild: discord.Guild, killer: discord.Member, targetID: int = None
+    ) -> Optional[Tuple[int, Optional[int]]]:
+        """Eliminate the killer's current target and hand its target to the killer.
+
+        Returns the victim's discord ID and the killer's new target, which is
+        None once the killer is the last player standing. Returns None, changing
+        nothing, if the killer has no target or it is no longer `targetID`.
+        """
+
+        async def work(conn: aiosqlite.Connection):
+            async with conn.execute(
+                f"SELECT targetID FROM {TABLE_NAME} WHERE guildID = ? AND discordID = ? AND status = ?;",
+                (guild.id, killer.id, PlayerStatus.ALIVE.value),
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None or row[0] is None:
+                return None
+            if targetID is not None and row[0] != targetID:
+                return None
+
+            victimID = row[0]
+            async with conn.execute(
+                f"SELECT targetID FROM {TABLE_NAME} WHERE guildID = ? AND discordID = ?;",
+                (guild.id, victimID),
+            ) as cursor:
+                nextID = (await cursor.fetchone())[0]
+            if nextID == killer.id:
+                nextID = None
+
+            await conn.execute(
+                f"UPDATE {TABLE_NAME} SET status = ?, targetID = NULL WHERE guildID = ? AND discordID = ?;",
+                (PlayerStatus.DEAD.value, guild.id, victimID),
+            )
+            await conn.execute(
+                f"UPDATE {TABLE_NAME} SET targetID = ? WHERE guildID = ? AND discordID = ?;",
+                (nextID, guild.id, killer.id),
+            )
+            return victimID, nextID
+
+        result = await self._db.run_unit(work)
+        if result is None:
+            return None
+
+        victimID, nextID = result
+        self.cache.invalidate(guild.id, victimID)
+        self.cache.invalidate(guild.id, killer.id)
+        self.counters.increment(guild.id, victimID, deaths=1)
+        self.counters.increment(guild.id, killer.id, kills=1)
+        self.leaderboard.add(guild.id, killer.id, kills=1)
+        return victimID, nextID
+
+    async def forfeit_player(self, guild: discord.Guild, player: discord.Member) -> bool:
+        """Mark an alive player as dead and close the target ring around them.
+
+        Returns False, changing nothing, if the player is no longer alive.
+        """
+
+        async def work(conn: aiosqlite.Connection) -> bool:
+            # Whoever hunts the player inherits their target below, so the
+            # target stays in place until the ring has been spliced
+            async with conn.execute(
+                f"UPDATE {TABLE_NAME} SET status = ? WHERE guildID = ? AND discordID = ? AND status = ?;",
+                (PlayerStatus.DEAD.value, guild.id, player.id, PlayerStatus.ALIVE.value),
+            ) as cursor:
+                if cursor.rowcount == 0:
+                    return False
+
+            await conn.execute(SPLICE_QUERY, (guild.id, player.id, guild.id, player.id))
+            await conn.execute(
+                f"UPDATE {TABLE_NAME} SET targetID = NULL WHERE guildID = ? AND discordID = ?;",
+                (guild.id, player.id),
+            )
+            return True
+
+        if not await self._db.run_unit(work):
+            return False
+
+        self.cache.invalidate_guild(guild.id)
+        self.counters.increment(guild.id, player.id, deaths=1)
+        return True
+
+    async def add_win(self, guild: discord.Guild, player: discord.Member) -> None:
+        """Record a win for the player."""
+        self.counters.increment(guild.id, player.id, wins=1)
+        self.leaderboard.add(guild.id, player.id, wins=1)
+
+    def _stats_flushed(self, keys: Iterable[Tuple[int, int]]) -> None:
+        # Cached rows predate the stat changes being written
+        for guildID, discordID in keys:
+            self.cache.invalidate(guildID, discordID)
+
+    async def _load_leaderboard(self, guild: discord.Guild) -> None:
+        # Retry if a stat changed while the rows were being read
+        while not self.leaderboard.is_loaded(guild.id):
+            version = self.leaderboard.version(guild.id)
+            async with self.counters.reading():
+                rows = await self._db.execute(
+                    f"SELECT discordID, name, wins, kills FROM {TABLE_NAME} WHERE guildID = ?;",
+                    (guild.id,),
+                    fetch="all",
+                    raw=True,
+                )
+                rows = [self._merge_ranking(guild.id, *row) for row in rows or ()]
+            self.leaderboard.load(guild.id, rows, version)
+
+    def _merge_ranking(
+        self, guildID: int, discordID: int, name: str, wins: int, kills: int
+    ) -> Tuple[int, str, int, int]:
+        pending = self.counters.pending(guildID, discordID)
+        if pending:
+            wins += pending["wins"]
+            kills += pending["kills"]
+        return discordID, name, wins, kills
+
+    async def get_leaderboard(
+        self, guild: discord.Guild, limit: int = 25
+    ) -> List[Tuple[int, str, int, int]]:
+        """Get the guild's best players as (discordID, name, wins, kills) tuples."""
+        await self._load_leaderboard(guild)
+        return self.leaderboard.top(guild.id, limit)
+
+    async def get_rank(
+        self, guild: discord.Guild, player: discord.Member
+    ) -> Optional[Tuple[int, int]]:
+        """Get a player's leaderboard rank and the number of ranked players."""
+        await self._load_leaderboard(guild)
+        return self.leaderboard.rank(guild.id, player.id)
@@ -0,0 +1,62 @@
+import re
+from typing import Dict, Iterable, List, Tuple
+
+from .database import Database
+
+# Plan steps that read every row of a table, e.g. "SCAN assassins"
+SCAN = re.compile(r"^SCAN (\w+)")
+ALIAS = re.compile(r"\b(?:FROM|JOIN|UPDATE)\s+(\w+)\s+AS\s+(\w+)", re.IGNORECASE)
+PLANNABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+class QueryAudit:
+    """Collects the statements run through a database and checks their plans.
+
+    Attach it with `db.audit = QueryAudit(db)`, exercise the repositories and
+    then `await audit.scans()` lists each registered statement whose plan
+    scans a table holding at least `minRows` rows.
+    """
+
+    def __init__(self, db: Database, *, minRows: int = 1000):
+        self._db = db
+        self.minRows = minRows
+        self.queries: Dict[str, Tuple] = {}
+
+    def register(self, query: str, values: Tuple) -> None:
+        self.queries.setdefault(query, tuple(values))
+
+    async def scans(self, ignore: Iterable[str] = ()) -> List[Tuple[str, str]]:
+        """Get (statement, plan step) pairs for every scan of a large table.
+
+        Statements in `ignore` are meant to read a whole table and are skipped.
+        """
+        ignore = set(ignore)
+        sizes: Dict[str, int] = {}
+        found = []
+        for query, values in list(self.queries.items()):
+            if query in ignore or not query.lstrip().upper().startswith(PLANNABLE):
+                continue
+
+            aliases = {alias: table for table, alias in ALIAS.findall(query)}
+            for step in await self._db.explain(query, values):
+                match = SCAN.match(step)
+                if match is None:
+                    continue
+
+                table = aliases.get(match[1], match[1])
+                if table not in sizes:
+                    sizes[table] = await self._count(table)
+                if sizes[table] >= self.minRows:
+                    found.append((" ".join(query.split()), step))
+
+        return found
+
+    async def _count(self, table: str) -> int:
+        # Read directly so the audit's own queries are not registered
+        async with self._db.acquire() as conn:
+            try:
+                async with conn.execute(f'SELECT COUNT(*) FROM "{table}";') as cursor:
+                    return (await cursor.fetchone())[0]
+            except Exception:
+                # Not a table, e.g. a subquery or CTE
+                return 0
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+import aiosqlite
+
+from .database import Database
+
+log = logging.getLogger(__name__)
+
+
+class BackupRestarted(Exception):
+    """The database kept changing under a backup until it gave up."""
+
+
+class Backups:
+    """Online copies of the database made with SQLite's backup API.
+
+    A backup copies `pages` pages per step on a connection of its own and
+    pauses `pause` seconds between steps. Each step holds the database's read
+    lock only briefly, so commands keep reading and writing throughout, and
+    the copying happens on the connection's thread rather than the event loop.
+
+    In WAL mode the copy is of the snapshot taken when it began, which writes
+    committed meanwhile do not disturb. With a rollback journal, every write
+    between two steps restarts the copy; after `maxRestarts` restarts the
+    backup is abandoned and left for the next run.
+    A background task makes a backup every `interval` seconds and keeps the
+    newest `keep` of them in `directory`.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        directory: str,
+        *,
+        interval: float = 86400.0,
+        keep: int = 7,
+        pages: int = 256,
+        pause: float = 0.005,
+        maxRestarts: int = 10,
+    ):
+        self._db = db
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        self.maxRestarts = maxRestarts
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def start(self) -> None:
+        """Start making backups on a timer."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="database-backups")
+
+    async def close(self) -> None:
+        """Stop the timer, abandoning a backup in progress."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def paths(self) -> List[str]:
+        """Get the paths of the finished backups, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+
+        prefix = f"{self._stem()}-"
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(".db")
+        )
+
+    async def backup(self) -> str:
+        """Back the database up now, prune old backups and return the new path.
+
+        The copy is written under a temporary name and only renamed once it is
+        complete, so a backup in the directory is never partial.
+        """
+        async with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+            path = os.path.join(self.directory, f"{self._stem()}-{stamp}.db")
+            partial = f"{path}.part"
+
+            started = time.perf_counter()
+            try:
+                await self._copy(partial)
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+
+            log.info(
+                f"Backed up the database to {path} in {time.perf_counter() - started:.2f}s."
+            )
+            self._prune()
+            return path
+
+    async def verify(self, path: Optional[str] = None) -> Tuple[str, List[str]]:
+        """Run an integrity check on a backup, the newest by default.
+
+        Returns the path checked and the problems found, which are just ["ok"]
+        for a sound backup. Raises FileNotFoundError when there is no backup
+        to check.
+        """
+        if path is None:
+            backups = self.paths()
+            if not backups:
+                raise FileNotFoundError("There are no backups to verify.")
+            path = backups[-1]
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No backup at {path}.")
+
+        async with aiosqlite.connect(f"file:{path}?mode=ro", uri=True) as conn:
+            async with conn.execute("PRAGMA integrity_check;") as cursor:
+                return path, [row[0] for row in await cursor.fetchall()]
+
+    async def _copy(self, path: str) -> None:
+        restarts = 0
+        remainingBefore = None
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            # Runs on the source connection's thread between two steps
+            nonlocal restarts, remainingBefore
+            # A step that copied pages but left no fewer to go started over
+            if (
+                status == sqlite3.SQLITE_OK
+                and remainingBefore is not None
+                and remaining >= remainingBefore
+            ):
+                restarts += 1
+                if restarts > self.maxRestarts:
+                    raise BackupRestarted(
+                        f"The backup restarted {restarts} times as the database changed."
+                    )
+            remainingBefore = remaining
+            time.sleep(self.pause)
+
+        async with aiosqlite.connect(self._db.dbName, isolation_level=None) as source:
+            if self._db.wal:
+                # Copy a snapshot: a read transaction held across the steps sees
+                # no later writes, so they never restart the copy
+                await source.execute("BEGIN;")
+                await source.execute("SELECT 1 FROM sqlite_master LIMIT 1;")
+            async with aiosqlite.connect(path) as target:
+                await source.backup(target, pages=self.pages, progress=progress)
+                # A copy of a WAL database is one too; keep backups to a single file
+                await target.execute("PRAGMA journal_mode = DELETE;")
+
+    def _prune(self) -> None:
+        backups = self.paths()
+        for path in backups[: max(0, len(backups) - self.keep)]:
+            os.remove(path)
+            log.info(f"Removed the old backup {path}.")
+
+    def _stem(self) -> str:
+        return os.path.splitext(os.path.basename(self._db.dbName))[0]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.backup()
+            except Exception as e:
+                log.error(f"Failed to back up the database: {e}")
@@ -0,0 +1,117 @@
+import time
+from collections import OrderedDict
+from copy import copy
+from typing import Dict, Optional, Tuple
+
+from database.records import Player
+
+# Returned by `get` when nothing is cached, as None is a cached "not registered"
+MISS = object()
+
+
+class PlayerCache:
+    """Bounded LRU/TTL cache of players, looked up by discordID or email.
+
+    Lookups that found no player are cached too, so repeated commands from
+    unregistered users are answered without a query. The repository
+    invalidates entries after every write that touches a player; writes to
+    many players invalidate the whole guild.
+
+    A lookup that raced a write must not cache what it read, so `version()`
+    is taken before reading from the database and passed to `put`, which
+    drops the result if anything was invalidated in between.
+    """
+
+    def __init__(self, *, maxEntries: int = 4096, ttl: float = 300.0):
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # (guildID, discordID) -> (expiry, guild generation, player or None)
+        self._players: OrderedDict[
+            Tuple[int, int], Tuple[float, int, Optional[Player]]
+        ] = OrderedDict()
+        # (guildID, email) -> (expiry, guild generation, discordID or None)
+        self._emails: OrderedDict[
+            Tuple[int, str], Tuple[float, int, Optional[int]]
+        ] = OrderedDict()
+        self._generations: Dict[int, int] = {}
+        self._version = 0
+
+    def version(self) -> int:
+        return self._version
+
+    def get(self, guildID: int, discordID: int):
+        """Get a copy of the cached player, None if they are not registered, or MISS."""
+        player = self._lookup(self._players, (guildID, discordID))
+        return self._count(player if player is MISS or player is None else copy(player))
+
+    def get_by_email(self, guildID: int, email: str):
+        """Like `get`, but for the player registered with an email."""
+        result = self._lookup(self._emails, (guildID, email))
+        if result is not MISS and result is not None:
+            player = self._lookup(self._players, (guildID, result))
+            # The email's player may have been invalidated since
+            if player is MISS or player is None or player.email != email:
+                result = MISS
+            else:
+                result = copy(player)
+        return self._count(result)
+
+    def put(self, guildID: int, discordID: int, player: Optional[Player], version: int) -> None:
+        """Cache a player looked up by discordID, or that they are not registered."""
+        if version != self._version:
+            return
+
+        self._store(self._players, (guildID, discordID), copy(player) if player else None)
+        if player is not None:
+            self._store(self._emails, (guildID, player.email), discordID)
+
+    def put_by_email(
+        self, guildID: int, email: str, player: Optional[Player], version: int
+    ) -> None:
+        """Cache a player looked up by email, or that no one registered with it."""
+        if version != self._version:
+            return
+
+        if player is None:
+            self._store(self._emails, (guildID, email), None)
+        else:
+            self.put(guildID, player.discordID, player, version)
+
+    def invalidate(self, guildID: int, discordID: int, email: str = None) -> None:
+        """Forget a player, and the lookup of their email if given."""
+        self._version += 1
+        self._players.pop((guildID, discordID), None)
+        if email is not None:
+            self._emails.pop((guildID, email), None)
+
+    def invalidate_guild(self, guildID: int) -> None:
+        """Forget every player in a guild."""
+        self._version += 1
+        self._generations[guildID] = self._generations.get(guildID, 0) + 1
+
+    def _lookup(self, entries: OrderedDict, key: Tuple):
+        entry = entries.get(key)
+        if entry is not None:
+            expiry, generation, value = entry
+            if expiry > time.monotonic() and generation == self._generations.get(key[0], 0):
+                entries.move_to_end(key)
+                return value
+            del entries[key]
+
+        return MISS
+
+    def _count(self, result):
+        if result is MISS:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def _store(self, entries: OrderedDict, key: Tuple, value) -> None:
+        generation = self._generations.get(key[0], 0)
+        entries[key] = (time.monotonic() + self.ttl, generation, value)
+        entries.move_to_end(key)
+        while len(entries) > self.maxEntries:
+            entries.popitem(last=False)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from database.database import Database
+
+log = logging.getLogger(__name__)
+
+# The player stats that are buffered, in the order deltas are stored
+STATS = ("kills", "deaths", "wins", "gamesPlayed")
+
+
+class StatCounters:
+    """Write-behind buffer for player stat increments.
+
+    Increments are added up in memory per (guildID, discordID) and written as
+    one batched `UPDATE ... SET kills = kills + ?` every `flushInterval`
+    seconds, or as soon as `maxPending` players have pending changes.
+
+    Reads that merge pending deltas into database rows must run inside
+    `reading()`, which keeps a flush from landing between the read and the
+    merge and counting a delta twice or not at all.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        table: str,
+        *,
+        flushInterval: float = 5.0,
+        maxPending: int = 500,
+        onFlush: Optional[Callable[[Iterable[Tuple[int, int]]], None]] = None,
+    ):
+        self._db = db
+        self.table = table
+        self.flushInterval = flushInterval
+        self.maxPending = maxPending
+        # Told which (guildID, discordID) deltas a flush is about to write
+        self.onFlush = onFlush
+        self._pending: Dict[Tuple[int, int], List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flushTask: Optional[asyncio.Task] = None
+        self._flushLock = asyncio.Lock()
+        self._flushing = False
+        self._flushed = asyncio.Event()
+        self._readers = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self) -> None:
+        """Start flushing on a timer."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="stat-counters")
+
+    async def close(self) -> None:
+        """Stop the timer and write out everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+    def increment(self, guildID: int, discordID: int, **deltas: int) -> None:
+        """Add to a player's stats, e.g. `increment(guildID, discordID, kills=1)`."""
+        pending = self._pending.get((guildID, discordID))
+        if pending is None:
+            pending = self._pending[(guildID, discordID)] = [0] * len(STATS)
+        for name, delta in deltas.items():
+            pending[STATS.index(name)] += delta
+
+        if len(self._pending) >= self.maxPending and self._flushTask is None:
+            self._flushTask = asyncio.create_task(self._flush_logged())
+
+    def discard(self, guildID: int, discordID: int) -> None:
+        """Forget a player's unwritten stat changes, e.g. once they are deleted."""
+        self._pending.pop((guildID, discordID), None)
+
+    def pending(self, guildID: int, discordID: int) -> Optional[Dict[str, int]]:
+        """Get a player's unwritten stat changes."""
+        pending = self._pending.get((guildID, discordID))
+        return dict(zip(STATS, pending)) if pending else None
+
+    def snapshot(self, guildID: int) -> Dict[Tuple[int, int], List[int]]:
+        """Copy a guild's unwritten stat changes, to merge from with `merge`."""
+        return {
+            key: list(deltas) for key, deltas in self._pending.items() if key[0] == guildID
+        }
+
+    def merge(
+        self, player, snapshot: Optional[Dict[Tuple[int, int], List[int]]] = None
+    ) -> None:
+        """Add a player's unwritten stat changes to a record read from the database.
+
+        The changes come from `snapshot` if given, otherwise from those pending now.
+        """
+        source = self._pending if snapshot is None else snapshot
+        pending = source.get((player.guildID, player.discordID))
+        if pending:
+            for name, delta in zip(STATS, pending):
+                setattr(player, name, (getattr(player, name) or 0) + delta)
+
+    @asynccontextmanager
+    async def reading(self) -> AsyncIterator[None]:
+        """Hold off flushes while reading rows that pending deltas are merged into."""
+        while self._flushing:
+            await self._flushed.wait()
+
+        self._readers += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._readers -= 1
+            if self._readers == 0:
+                self._idle.set()
+
+    async def flush(self) -> None:
+        """Write every pending stat change in a single batched UPDATE."""
+        async with self._flushLock:
+            if not self._pending:
+                return
+
+            self._flushing = True
+            self._flushed.clear()
+            try:
+                await self._idle.wait()
+                pending, self._pending = self._pending, {}
+                if self.onFlush is not None:
+                    self.onFlush(pending.keys())
+                try:
+                    await self._db.run_many(
+                        f"""UPDATE {self.table} SET {", ".join(f"{name} = {name} + ?" for name in STATS)}
+                        WHERE guildID = ? AND discordID = ?;
+                        """,
+                        (
+                            (*deltas, guildID, discordID)
+                            for (guildID, discordID), deltas in pending.items()
+                        ),
+                    )
+                except Exception:
+                    # Keep the deltas, including any added meanwhile, for the next flush
+                    for key, deltas in pending.items():
+                        current = self._pending.setdefault(key, [0] * len(STATS))
+                        for index, delta in enumerate(deltas):
+                            current[index] += delta
+                    raise
+            finally:
+                self._flushing = False
+                self._flushed.set()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flushInterval)
+            await self._flush_logged()
+
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error(f"Failed to flush {len(self._pending)} stat change(s): {e}")
+        finally:
+            if self._flushTask is asyncio.current_task():
+                self._flushTask = None
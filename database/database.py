@@ -1,40 +1,239 @@
+import asyncio
+import logging
+import random
+import sqlite3
+import time
 import aiosqlite
-from typing import Any, Optional, Tuple
-from collections import namedtuple
+from contextlib import asynccontextmanager
+from copy import copy
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from .pool import ConnectionPool
+from .records import Record, row_factory
+from .writer import Writer
+from utils.metrics import Histogram, Instrumentation
+
+# Settings applied to every connection when write-ahead logging is enabled
+WAL_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "mmap_size": 268435456,
+}
+
+# Lets maintenance hand free pages back in small steps (incremental_vacuum). It
+# only takes effect on a new database, so it is applied before anything else.
+AUTO_VACUUM = {"auto_vacuum": "INCREMENTAL"}
+
+# Rows fetched per round trip by the "many" fetch mode and by `iterate`
+BATCH_SIZE = 500
+
+log = logging.getLogger(__name__)
+
+
+def _is_busy(error: Exception) -> bool:
+    """Whether a statement failed because another connection holds the lock."""
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is None:
+        return "database is locked" in str(error)
+    # Extended codes such as SQLITE_BUSY_SNAPSHOT keep the primary code in the low byte
+    return code & 0xFF == sqlite3.SQLITE_BUSY
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+async def _retry_busy(
+    statement: Callable[[], Awaitable[Any]], retries: int, backoff: float
+) -> Any:
+    """Run a statement, retrying with jittered exponential backoff while busy."""
+    for attempt in range(retries + 1):
+        try:
+            return await statement()
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not _is_busy(e):
+                raise
+            await asyncio.sleep(backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+
+class Transaction:
+    """The statements of one `Database.transaction()` block.
+
+    `execute` works like `Database.execute` but always runs on the
+    transaction's connection, and nothing is committed until the block exits.
+    """
+
+    def __init__(self, db: "Database", conn: aiosqlite.Connection):
+        self._db = db
+        self.conn = conn
+
+    async def execute(
+        self,
+        query: str,
+        values: Tuple = (),
+        *,
+        fetch: str = None,
+        record: Type[Record] = None,
+        raw: bool = False,
+    ) -> Optional[Any]:
+        """Execute a statement in the transaction and return its result."""
+        start = time.perf_counter()
+        error = False
+        try:
+            return await self._db._execute(
+                self.conn, query, values, fetch, False, record, raw
+            )
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self._db._observe(query, values, start, error)
 
 
 class Database:
-    def __init__(self, dbName: str):
+    def __init__(
+        self,
+        dbName: str,
+        *,
+        poolSize: int = 4,
+        wal: bool = False,
+        readAfterWrite: bool = False,
+        instruments: Optional[Instrumentation] = None,
+        slowQueryThreshold: Optional[float] = None,
+    ):
         self.dbName = dbName
+        self.poolSize = poolSize
+        self.wal = wal
+        self.readAfterWrite = readAfterWrite
+        self._pool: Optional[ConnectionPool] = None
+        self._writer: Optional[Writer] = None
+        # Seconds taken by recent statements, including any wait for the writer
+        self.latency = Histogram()
+        # Per-statement timings, labelled by normalized SQL, when instrumented
+        self.instruments = instruments
+        # Statements slower than this many seconds are logged with their plan
+        self.slowQueryThreshold = slowQueryThreshold
+        # Set by tests to collect every statement for a query plan audit
+        self.audit = None
+        self._plans: Dict[str, List[str]] = {}
+        self._slowQueries: Set[asyncio.Task] = set()
+        # Identical concurrent reads share one execution; see `_read`
+        self.reads = 0
+        self.coalescedReads = 0
+        self._flights: Dict[Tuple, List] = {}
+        self._writes = 0
 
     @staticmethod
-    async def _fetch(cursor: aiosqlite.Cursor, mode: str) -> Optional[Any]:
-        """Fetch the result and return it as a namedtuple if data exists."""
+    async def _fetch(
+        cursor: aiosqlite.Cursor,
+        mode: str,
+        record: Optional[Type[Record]] = None,
+        raw: bool = False,
+        size: int = BATCH_SIZE,
+    ) -> Optional[Any]:
+        """Fetch the result and return it as records if data exists.
+
+        Rows become `record` instances when a record type is given, otherwise
+        namedtuples; `raw` skips conversion and returns the plain tuples. The
+        "many" mode fetches up to `size` rows.
+        """
         if mode == "one":
             row = await cursor.fetchone()
             if row:
-                return Database._row_to_namedtuple(cursor, row)
+                return row if raw else Database._factory(cursor, record)(row)
         elif mode == "many":
-            rows = await cursor.fetchmany()
+            rows = await cursor.fetchmany(size)
             if rows:
-                return [Database._row_to_namedtuple(cursor, row) for row in rows]
+                return rows if raw else list(map(Database._factory(cursor, record), rows))
         elif mode == "all":
             rows = await cursor.fetchall()
             if rows:
-                return [Database._row_to_namedtuple(cursor, row) for row in rows]
+                return rows if raw else list(map(Database._factory(cursor, record), rows))
         return None
 
     @staticmethod
-    def _row_to_namedtuple(cursor: aiosqlite.Cursor, row: Tuple) -> namedtuple:
-        """Convert a database row into a namedtuple using cursor column descriptions."""
-        columns = [col[0] for col in cursor.description]
+    def _factory(
+        cursor: aiosqlite.Cursor, record: Optional[Type[Record]]
+    ) -> Callable[[Tuple], Any]:
+        """Get the cached row factory for the cursor's column layout."""
+        columns = tuple(col[0] for col in cursor.description)
+        return row_factory(columns, record)
+
+    async def open(self) -> None:
+        """Open the long-lived connection pool.
 
-        RowTuple = namedtuple("RowTuple", columns)
-        return RowTuple(*row)
+        In WAL mode the dedicated writer is opened first, as it is the
+        connection that switches the database file over to write-ahead logging.
+        The pooled connections then become a read-only set used for SELECTs.
+        """
+        if self._pool is not None:
+            return
 
-    async def connect(self) -> aiosqlite.Connection:
-        """Connect to the database and return the connection object."""
-        return aiosqlite.connect(self.dbName)
+        pragmas = AUTO_VACUUM
+        if self.wal:
+            writer = Writer(
+                self.dbName, pragmas={**AUTO_VACUUM, "journal_mode": "WAL", **WAL_PRAGMAS}
+            )
+            await writer.open()
+            self._writer = writer
+            pragmas = {**WAL_PRAGMAS, "query_only": "ON"}
+
+        pool = ConnectionPool(self.dbName, self.poolSize, pragmas=pragmas)
+        try:
+            await pool.open()
+        except Exception:
+            await self.close()
+            raise
+
+        self._pool = pool
+
+    async def close(self) -> None:
+        """Flush queued writes and close every connection."""
+        if self._slowQueries:
+            await asyncio.gather(*self._slowQueries, return_exceptions=True)
+
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            await writer.close()
+
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a connection for the duration of the block.
+
+        Connections come from the pool once it has been opened, otherwise a
+        short-lived connection is opened and closed around the block.
+        """
+        if self._pool is None:
+            async with aiosqlite.connect(self.dbName) as conn:
+                yield conn
+            return
+
+        # Release to the pool the connection came from, even if the database
+        # is being closed meanwhile
+        pool = self._pool
+        conn = await pool.acquire()
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
 
     async def execute(
         self,
@@ -43,29 +242,379 @@ class Database:
         *,
         fetch: str = None,
         commit: bool = False,
-        conn: aiosqlite.Connection = None
+        conn: aiosqlite.Connection = None,
+        consistent: bool = None,
+        record: Type[Record] = None,
+        raw: bool = False,
+        size: int = BATCH_SIZE
+    ) -> Optional[Any]:
+        """Execute a query and return the result.
+
+        In WAL mode every write (anything committed or not fetched) is handed to
+        the writer task and this call returns once its batch has been committed.
+        Reads run on the read-only connections alongside it; with `consistent`
+        (defaulting to `readAfterWrite`) a read first waits for every write
+        queued before it to be committed.
+
+        Fetched rows are converted to `record` instances (or namedtuples when no
+        record type is given) unless `raw` asks for the plain tuples. The
+        "many" fetch mode returns at most `size` rows; use `iterate` to stream
+        a large result instead.
+
+        Reads without a `conn` are coalesced: a read identical to one already
+        in flight waits for and shares its result.
+        """
+        start = time.perf_counter()
+        error = False
+        write = commit or fetch is None
+        if write:
+            self._writes += 1
+        try:
+            if self._writer is not None:
+                if write:
+                    return await self._writer.submit(
+                        lambda conn: self._execute(
+                            conn, query, values, fetch, False, record, raw, size
+                        )
+                    )
+
+                if consistent if consistent is not None else self.readAfterWrite:
+                    await self._writer.drain()
+
+            if conn is None:
+                if not write:
+                    return await self._read(query, values, fetch, record, raw, size)
+
+                async with self.acquire() as conn:
+                    return await self._execute(
+                        conn, query, values, fetch, commit, record, raw, size
+                    )
+
+            return await self._execute(
+                conn, query, values, fetch, commit, record, raw, size
+            )
+        except BaseException:
+            error = True
+            raise
+        finally:
+            if write:
+                self._writes += 1
+            self._observe(query, values, start, error)
+
+    async def _read(
+        self,
+        query: str,
+        values: Tuple,
+        fetch: str,
+        record: Optional[Type[Record]],
+        raw: bool,
+        size: int,
+    ) -> Optional[Any]:
+        """Run a read, sharing one execution between identical concurrent reads.
+
+        The key includes a counter bumped as every write starts and finishes,
+        so a read never joins one that began before a write it should see.
+        Callers sharing a result each get their own copy of its records.
+        """
+        self.reads += 1
+        try:
+            key = (self._writes, query, tuple(values), fetch, record, raw, size)
+            flight = self._flights.get(key)
+        except TypeError:
+            # Unhashable parameters, e.g. a dict of named values
+            key, flight = None, None
+
+        if flight is not None:
+            self.coalescedReads += 1
+            flight[1] += 1
+            return self._share(await asyncio.shield(flight[0]))
+
+        flight = [None, 0]
+        flight[0] = asyncio.ensure_future(
+            self._fly(key, query, values, fetch, record, raw, size)
+        )
+        # Every caller may be cancelled before the read fails, leaving its
+        # error unretrieved
+        flight[0].add_done_callback(_retrieve)
+        if key is not None:
+            self._flights[key] = flight
+        result = await asyncio.shield(flight[0])
+        return self._share(result) if flight[1] else result
+
+    async def _fly(
+        self,
+        key: Optional[Tuple],
+        query: str,
+        values: Tuple,
+        fetch: str,
+        record: Optional[Type[Record]],
+        raw: bool,
+        size: int,
     ) -> Optional[Any]:
-        """Execute a query and return the result."""
-        async with aiosqlite.connect(self.dbName) as conn:
-            cursor = await conn.cursor()
-            await cursor.execute(query, values)
+        try:
+            async with self.acquire() as conn:
+                return await self._execute(
+                    conn, query, values, fetch, False, record, raw, size
+                )
+        finally:
+            # Leave before anyone resumes, so no one joins a finished read
+            if key is not None:
+                del self._flights[key]
 
+    @staticmethod
+    def _share(result: Optional[Any]) -> Optional[Any]:
+        # Records are mutable, so every caller gets its own; tuples are shared
+        if isinstance(result, list):
+            return [copy(row) if isinstance(row, Record) else row for row in result]
+        return copy(result) if isinstance(result, Record) else result
+
+    def _observe(
+        self, query: Optional[str], values: Tuple, start: float, error: bool
+    ) -> None:
+        elapsed = time.perf_counter() - start
+        self.latency.record(elapsed)
+        if query is None:
+            return
+
+        if self.instruments is not None:
+            self.instruments.observe_query(query, elapsed, error)
+        if self.audit is not None:
+            self.audit.register(query, values)
+        if self.slowQueryThreshold is not None and elapsed >= self.slowQueryThreshold:
+            # Explain the statement off the caller's path
+            task = asyncio.create_task(self._log_slow_query(query, values, elapsed))
+            self._slowQueries.add(task)
+            task.add_done_callback(self._slowQueries.discard)
+
+    async def _log_slow_query(self, query: str, values: Tuple, elapsed: float) -> None:
+        try:
+            plan = "; ".join(await self.explain(query, values)) or "none"
+        except Exception as e:
+            plan = f"unavailable ({e})"
+
+        statement = " ".join(query.split())
+        shapes = ", ".join(type(value).__name__ for value in values)
+        log.warning(
+            f"Slow query took {elapsed * 1000:.1f}ms: {statement} "
+            f"| parameters: ({shapes}) | plan: {plan}"
+        )
+
+    async def explain(self, query: str, values: Tuple = ()) -> List[str]:
+        """Get the `EXPLAIN QUERY PLAN` steps for a statement, cached per statement."""
+        plan = self._plans.get(query)
+        if plan is None:
+            async with self.acquire() as conn:
+                async with conn.execute(f"EXPLAIN QUERY PLAN {query}", values) as cursor:
+                    plan = [row[3] for row in await cursor.fetchall()]
+            self._plans[query] = plan
+
+        return plan
+
+    async def _execute(
+        self,
+        conn: aiosqlite.Connection,
+        query: str,
+        values: Tuple,
+        fetch: Optional[str],
+        commit: bool,
+        record: Optional[Type[Record]] = None,
+        raw: bool = False,
+        size: int = BATCH_SIZE,
+    ) -> Optional[Any]:
+        cursor = await conn.execute(query, values)
+        try:
             if fetch is not None:
-                result = await self._fetch(cursor, fetch)
+                result = await self._fetch(cursor, fetch, record, raw, size)
             else:
                 result = None
+        finally:
+            # Closing first finishes any RETURNING statement before the commit
+            await cursor.close()
 
-            if commit:
-                await conn.commit()
+        if commit:
+            await conn.commit()
 
-            await cursor.close()
-            if conn is None:
-                await conn.close()
+        return result
+
+    async def iterate(
+        self,
+        query: str,
+        values: Tuple = (),
+        *,
+        batch_size: int = BATCH_SIZE,
+        consistent: bool = None,
+        record: Type[Record] = None,
+        raw: bool = False,
+    ) -> AsyncIterator[Any]:
+        """Stream a query's rows, fetching `batch_size` rows per round trip.
+
+        Only one batch is held in memory at a time, so a result of any size
+        can be processed. The connection is held until the iteration finishes
+        or the generator is closed, so keep the loop body short.
+        """
+        if self._writer is not None:
+            if consistent if consistent is not None else self.readAfterWrite:
+                await self._writer.drain()
+        if self.audit is not None:
+            self.audit.register(query, values)
+
+        async with self.acquire() as conn:
+            async with conn.execute(query, values) as cursor:
+                convert = None if raw else self._factory(cursor, record)
+                while rows := await cursor.fetchmany(batch_size):
+                    for row in rows:
+                        yield row if raw else convert(row)
+
+    @asynccontextmanager
+    async def transaction(
+        self, *, retries: int = 5, backoff: float = 0.05
+    ) -> AsyncIterator[Transaction]:
+        """Run the block's statements as one transaction on a single connection.
+
+        The transaction starts with BEGIN IMMEDIATE, so it holds the write lock
+        before its first statement and cannot fail half way with SQLITE_BUSY.
+        Beginning and committing are retried up to `retries` times while
+        another connection holds the lock, waiting about `backoff` seconds,
+        doubled after every attempt. An exception leaving the block rolls
+        every statement back.
+
+        In WAL mode the block borrows the writer's connection between two of
+        its batches, so keep it short and free of anything but database work.
+        """
+        self._writes += 1
+        try:
+            async with self.writing() as conn:
+                await _retry_busy(
+                    lambda: conn.execute("BEGIN IMMEDIATE;"), retries, backoff
+                )
+                try:
+                    yield Transaction(self, conn)
+                    await _retry_busy(conn.commit, retries, backoff)
+                except BaseException:
+                    if conn.in_transaction:
+                        await conn.rollback()
+                    raise
+        finally:
+            self._writes += 1
 
-            return result
+    @asynccontextmanager
+    async def writing(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a connection that may write, outside of any transaction.
+
+        In WAL mode this is the writer's connection, held between two of its
+        batches; otherwise a pooled connection. Statements that cannot run in
+        a transaction, such as checkpoints, belong here.
+        """
+        if self._writer is not None:
+            async with self._writer.exclusive() as conn:
+                yield conn
+        else:
+            async with self.acquire() as conn:
+                yield conn
 
     async def run(
         self, query: str, values: Tuple = (), conn: aiosqlite.Connection = None
     ) -> None:
         """Execute a query and commit the changes."""
         await self.execute(query, values, commit=True, conn=conn)
+
+    async def run_atomic(
+        self,
+        statements: Iterable[Tuple[str, Tuple]],
+        conn: aiosqlite.Connection = None,
+    ) -> None:
+        """Execute several (query, values) statements and commit them all or none."""
+        statements = list(statements)
+
+        async def work(conn: aiosqlite.Connection) -> None:
+            for query, values in statements:
+                await conn.execute(query, values)
+
+        await self.run_unit(work, conn=conn)
+
+    async def run_unit(
+        self,
+        work: Callable[[aiosqlite.Connection], Awaitable[Any]],
+        conn: aiosqlite.Connection = None,
+    ) -> Any:
+        """Run `work(conn)` as one atomic unit of writes and return its result.
+
+        The work may read as well as write, and must only use the connection it
+        is given. In WAL mode it runs on the writer task, so it may be replayed
+        if another statement in its batch fails.
+        """
+        start = time.perf_counter()
+        self._writes += 1
+        try:
+            if self._writer is not None:
+                return await self._writer.submit(work)
+
+            if conn is None:
+                async with self.acquire() as conn:
+                    return await self._execute_unit(conn, work)
+
+            return await self._execute_unit(conn, work)
+        finally:
+            self._writes += 1
+            # Units run several statements, so only their overall latency is kept
+            self._observe(None, (), start, False)
+
+    @staticmethod
+    async def _execute_unit(
+        conn: aiosqlite.Connection,
+        work: Callable[[aiosqlite.Connection], Awaitable[Any]],
+    ) -> Any:
+        try:
+            # DDL does not open an implicit transaction, so begin one explicitly
+            if not conn.in_transaction:
+                await conn.execute("BEGIN IMMEDIATE;")
+            result = await work(conn)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+        return result
+
+    async def run_many(
+        self,
+        query: str,
+        values: Iterable[Tuple],
+        conn: aiosqlite.Connection = None,
+    ) -> None:
+        """Execute a query once per set of values and commit them together."""
+        # The writer may replay a batch, so the values must be reusable
+        values = list(values)
+        start = time.perf_counter()
+        error = False
+        self._writes += 1
+        try:
+            if self._writer is not None:
+                await self._writer.submit(
+                    lambda conn: self._execute_many(conn, query, values, False)
+                )
+            elif conn is None:
+                async with self.acquire() as conn:
+                    await self._execute_many(conn, query, values, True)
+            else:
+                await self._execute_many(conn, query, values, True)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self._writes += 1
+            self._observe(query, values[0] if values else (), start, error)
+
+    @staticmethod
+    async def _execute_many(
+        conn: aiosqlite.Connection, query: str, values: List[Tuple], commit: bool
+    ) -> None:
+        try:
+            cursor = await conn.executemany(query, values)
+            await cursor.close()
+            if commit:
+                await conn.commit()
+        except Exception:
+            if commit:
+                await conn.rollback()
+            raise
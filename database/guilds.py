@@ -1,87 +1,134 @@
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 import discord
-from database.database import Database
+from database.database import BATCH_SIZE, Database
+from database.records import Guild
+
+DEFAULT_PREFIX = "!"
 
 
 class Guilds:
     def __init__(self, db: Database):
         self._db = db
-
-    async def create_table(self) -> None:
-        conn = await self._db.connect()
-        query = f"""
-            CREATE TABLE IF NOT EXISTS guilds (
-                guildID BIGINT PRIMARY KEY,
-                prefix TEXT NOT NULL DEFAULT '!',
-                assassinsChannelID BIGINT,
-                assassinsStarted BOOLEAN DEFAULT FALSE
-            );
-            """
-
-        await self._db.run(
-            query,
-            conn=conn,
-        )
-        await conn.close()
+        self._prefixes: Dict[int, str] = {}
+        self._channels: Dict[Tuple[int, str], Optional[int]] = {}
 
     async def add_guild(self, guildID: int) -> None:
         """Add a guild to the database."""
-        conn = await self._db.connect()
-        await self._db.run(
-            f"INSERT INTO guilds (guildID) VALUES (?);",
-            (guildID,),
-            conn=conn,
+        async with self._db.acquire() as conn:
+            await self._db.run(
+                f"INSERT INTO guilds (guildID) VALUES (?);",
+                (guildID,),
+                conn=conn,
+            )
+
+    async def add_guilds(self, guildIDs: Iterable[int]) -> None:
+        """Add several guilds to the database, skipping any that already exist."""
+        guildIDs = list(guildIDs)
+        await self._db.run_many(
+            f"INSERT OR IGNORE INTO guilds (guildID) VALUES (?);",
+            ((guildID,) for guildID in guildIDs),
         )
-        await conn.close()
+        for guildID in guildIDs:
+            self._prefixes.setdefault(guildID, DEFAULT_PREFIX)
+
+    async def remove_guild(self, guildID: int) -> None:
+        """Remove a guild from the database."""
+        await self._db.run(f"DELETE FROM guilds WHERE guildID = ?;", (guildID,))
+        self._prefixes.pop(guildID, None)
+        for key in [key for key in self._channels if key[0] == guildID]:
+            del self._channels[key]
+
+    async def sync_guilds(self, guildIDs: Iterable[int]) -> List[int]:
+        """Add every guild in `guildIDs` missing from the database.
+
+        Returns the IDs of the guilds that were added.
+        """
+        existing = {
+            row[0] async for row in self._db.iterate(f"SELECT guildID FROM guilds;", raw=True)
+        }
+        missing = [guildID for guildID in guildIDs if guildID not in existing]
+
+        if missing:
+            await self.add_guilds(missing)
+        return missing
 
     async def get_guild(self, guildID: int) -> bool:
         """Check if the guild exists in the database."""
         query = f"SELECT guildID FROM guilds WHERE guildID = ?;"
-        result = await self._db.execute(query, (guildID,), fetch="one")
+        result = await self._db.execute(query, (guildID,), fetch="one", record=Guild)
 
         return result
 
     async def get_all_guilds(self):
         """Get all guilds in the database."""
         query = f"SELECT * FROM guilds;"
-        result = await self._db.execute(query, fetch="all")
+        result = await self._db.execute(query, fetch="all", record=Guild)
 
         return result
 
+    async def iter_all_guilds(self, batch_size: int = BATCH_SIZE) -> AsyncIterator[Guild]:
+        """Stream every guild in the database, `batch_size` rows at a time."""
+        query = f"SELECT * FROM guilds;"
+        async for guild in self._db.iterate(query, batch_size=batch_size, record=Guild):
+            yield guild
+
+    async def load_prefixes(self) -> None:
+        """Load every guild's prefix into the prefix cache."""
+        query = f"SELECT guildID, prefix FROM guilds;"
+        self._prefixes = {
+            guildID: prefix async for guildID, prefix in self._db.iterate(query, raw=True)
+        }
+
+    def cached_prefix(self, guildID: int) -> Optional[str]:
+        """Get the cached prefix for the specified guild, if it is known."""
+        return self._prefixes.get(guildID)
+
     async def get_prefix(self, guild: discord.Guild) -> str:
         """Get the prefix for the specified guild."""
+        prefix = self._prefixes.get(guild.id)
+        if prefix is not None:
+            return prefix
+
         query = f"SELECT prefix FROM guilds WHERE guildID = ?;"
         result = await self._db.execute(query, (guild.id,), fetch="one")
 
-        return result.prefix if result else "!"
+        prefix = result.prefix if result else DEFAULT_PREFIX
+        self._prefixes[guild.id] = prefix
+        return prefix
 
     async def set_prefix(self, guild: discord.Guild, prefix: str) -> None:
         """Set the prefix for the specified guild."""
         query = f"UPDATE guilds SET prefix = ? WHERE guildID = ?;"
         await self._db.execute(query, (prefix, guild.id), commit=True)
+        self._prefixes[guild.id] = prefix
 
     async def get_channel(self, guild: discord.Guild, channelType: str) -> int:
         """Get the channel ID for the specified guild."""
-        channelType = f"{channelType}ChannelID"
-        print(channelType)
-        query = f"SELECT {channelType} FROM guilds WHERE guildID = ?;"
-        print(query)
+        key = (guild.id, channelType)
+        if key in self._channels:
+            return self._channels[key]
+
+        column = f"{channelType}ChannelID"
+        query = f"SELECT {column} FROM guilds WHERE guildID = ?;"
         result = await self._db.execute(query, (guild.id,), fetch="one")
-        return result[0] if result else None
+
+        channelID = result[0] if result else None
+        self._channels[key] = channelID
+        return channelID
 
     async def set_channel(
         self, guild: discord.Guild, channelType: str, channelID: discord.TextChannel
     ) -> None:
         """Set the channel ID for the specified guild."""
-        channelType = f"{channelType}ChannelID"
-        query = f"UPDATE guilds SET {channelType} = ? WHERE guildID = ?;"
+        column = f"{channelType}ChannelID"
+        query = f"UPDATE guilds SET {column} = ? WHERE guildID = ?;"
         await self._db.execute(query, (channelID.id, guild.id), commit=True)
+        self._channels[(guild.id, channelType)] = channelID.id
 
     async def get_allowed_columns(self):
         """Get the allowed columns dynamically from the database schema."""
-        query = """
-        PRAGMA table_info(guilds);  -- This query fetches the column names of the guilds table
-        """
+        query = "PRAGMA table_info(guilds);"
         result = await self._db.execute(query, fetch="all")
 
-        allowed_columns = [row["name"] for row in result]
+        allowed_columns = [row.name for row in result or ()]
         return allowed_columns
@@ -0,0 +1,119 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+# (-wins, -kills, discordID): ascending order puts the best players first
+Key = Tuple[int, int, int]
+
+
+class Board:
+    """One guild's players, kept sorted by wins and then kills.
+
+    The keys live in a SortedList, so adding, removing and ranking a player
+    take logarithmic time however large the guild is.
+    """
+
+    __slots__ = ("keys", "players")
+
+    def __init__(self):
+        self.keys: SortedList = SortedList()
+        self.players: Dict[int, Tuple[Key, str]] = {}
+
+    def update(self, discordID: int, name: str, wins: int, kills: int) -> None:
+        self.remove(discordID)
+        key = (-(wins or 0), -(kills or 0), discordID)
+        self.keys.add(key)
+        self.players[discordID] = (key, name)
+
+    def remove(self, discordID: int) -> None:
+        entry = self.players.pop(discordID, None)
+        if entry is not None:
+            self.keys.remove(entry[0])
+
+
+class Leaderboard:
+    """In-memory, per-guild rankings maintained as player stats change.
+
+    A guild's board is loaded once from the database and then updated by the
+    repository after every stat change. Looking up a rank is a binary search
+    and listing the top K players reads K entries, so neither scans the table.
+    """
+
+    def __init__(self):
+        self._boards: Dict[int, Board] = {}
+        self._versions: Dict[int, int] = {}
+
+    def is_loaded(self, guildID: int) -> bool:
+        return guildID in self._boards
+
+    def version(self, guildID: int) -> int:
+        """Count of changes seen for a guild while its board was not loaded."""
+        return self._versions.get(guildID, 0)
+
+    def load(
+        self, guildID: int, rows: Iterable[Tuple[int, str, int, int]], version: int
+    ) -> bool:
+        """Build a guild's board from (discordID, name, wins, kills) rows.
+
+        The rows are discarded, returning False, if the guild changed since
+        `version` was read, as they may be missing that change.
+        """
+        if self.version(guildID) != version:
+            return False
+
+        board = Board()
+        for discordID, name, wins, kills in rows:
+            board.update(discordID, name, wins, kills)
+        self._boards[guildID] = board
+        return True
+
+    def update(
+        self, guildID: int, discordID: int, name: str, wins: int, kills: int
+    ) -> None:
+        board = self._boards.get(guildID)
+        if board is None:
+            self._versions[guildID] = self.version(guildID) + 1
+            return
+        board.update(discordID, name, wins, kills)
+
+    def add(self, guildID: int, discordID: int, wins: int = 0, kills: int = 0) -> None:
+        """Add to the wins and kills of a player already on the board."""
+        board = self._boards.get(guildID)
+        if board is None:
+            self._versions[guildID] = self.version(guildID) + 1
+            return
+
+        entry = board.players.get(discordID)
+        if entry is not None:
+            (negativeWins, negativeKills, _), name = entry
+            board.update(discordID, name, wins - negativeWins, kills - negativeKills)
+
+    def remove(self, guildID: int, discordID: int) -> None:
+        board = self._boards.get(guildID)
+        if board is None:
+            self._versions[guildID] = self.version(guildID) + 1
+            return
+        board.remove(discordID)
+
+    def drop(self, guildID: int) -> None:
+        """Forget a guild's board; it is loaded again on next use."""
+        self._boards.pop(guildID, None)
+        self._versions[guildID] = self.version(guildID) + 1
+
+    def top(self, guildID: int, limit: int) -> List[Tuple[int, str, int, int]]:
+        """Get the best players as (discordID, name, wins, kills) tuples."""
+        board = self._boards[guildID]
+        return [
+            (discordID, board.players[discordID][1], -wins, -kills)
+            for wins, kills, discordID in board.keys.islice(0, limit)
+        ]
+
+    def rank(self, guildID: int, discordID: int) -> Optional[Tuple[int, int]]:
+        """Get a player's rank, shared by tied players, and the number of players."""
+        board = self._boards[guildID]
+        entry = board.players.get(discordID)
+        if entry is None:
+            return None
+
+        wins, kills, _ = entry[0]
+        return board.keys.bisect_left((wins, kills)) + 1, len(board.keys)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from .database import Database
+
+log = logging.getLogger(__name__)
+
+
+class Maintenance:
+    """Refreshes planner statistics, frees unused pages and checkpoints the WAL.
+
+    A background task runs `run()` every `interval` seconds, once no statement
+    has finished for `idleFor` seconds. A run works in short steps on the
+    writing connection and stops after `timeLimit` seconds, or as soon as a
+    foreground statement runs between two steps, leaving the rest for the
+    next run.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        *,
+        interval: float = 3600.0,
+        idleFor: float = 10.0,
+        timeLimit: float = 1.0,
+        vacuumPages: int = 256,
+    ):
+        self._db = db
+        self.interval = interval
+        self.idleFor = idleFor
+        self.timeLimit = timeLimit
+        # Pages freed per incremental_vacuum step
+        self.vacuumPages = vacuumPages
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start running maintenance on a timer."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="database-maintenance")
+
+    async def close(self) -> None:
+        """Stop the timer, interrupting a run between two of its steps."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> List[str]:
+        """Run the maintenance steps now and return the ones that finished.
+
+        Planner statistics are gathered with ANALYZE the first time and kept
+        current with `PRAGMA optimize` afterwards. Free pages are returned to
+        the file system `vacuumPages` at a time, and in WAL mode the log is
+        checkpointed without waiting on readers.
+        """
+        deadline = time.perf_counter() + self.timeLimit
+        statements = self._db.latency.count
+        done = []
+
+        async def step(name: str, *queries: str) -> Optional[List]:
+            # Foreground work goes first: give up once it shows up or time is out
+            if self._db.latency.count != statements or time.perf_counter() >= deadline:
+                log.debug(f"Stopping database maintenance before {name}.")
+                return None
+
+            async with self._db.writing() as conn:
+                for query in queries:
+                    async with conn.execute(query) as cursor:
+                        # incremental_vacuum frees one page per row stepped
+                        rows = await cursor.fetchall()
+            done.append(name)
+            return rows
+
+        stats = await self.stats()
+        if stats["analyzed"]:
+            rows = await step("optimize", "PRAGMA optimize;")
+        else:
+            rows = await step("analyze", "PRAGMA analysis_limit = 400;", "ANALYZE;")
+
+        freePages = stats["freelistSize"] // stats["pageSize"]
+        while rows is not None and stats["autoVacuum"] == 2 and freePages:
+            rows = await step(
+                "incremental_vacuum",
+                f"PRAGMA incremental_vacuum({self.vacuumPages});",
+                "PRAGMA freelist_count;",
+            )
+            freePages = rows[0][0] if rows else 0
+
+        if rows is not None and self._db.wal:
+            await step("checkpoint", "PRAGMA wal_checkpoint(PASSIVE);")
+
+        return done
+
+    async def stats(self) -> Dict[str, int]:
+        """Get the database's file, free list and WAL sizes in bytes.
+
+        Also reports the page size, the auto_vacuum mode (2 is incremental)
+        and whether planner statistics have been gathered.
+        """
+        values = {}
+        async with self._db.acquire() as conn:
+            for name in ("page_size", "page_count", "freelist_count", "auto_vacuum"):
+                async with conn.execute(f"PRAGMA {name};") as cursor:
+                    values[name] = (await cursor.fetchone())[0]
+            async with conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1';"
+            ) as cursor:
+                analyzed = await cursor.fetchone() is not None
+
+        wal = f"{self._db.dbName}-wal"
+        return {
+            "fileSize": os.path.getsize(self._db.dbName),
+            "freelistSize": values["freelist_count"] * values["page_size"],
+            "walSize": os.path.getsize(wal) if os.path.exists(wal) else 0,
+            "pageSize": values["page_size"],
+            "autoVacuum": values["auto_vacuum"],
+            "analyzed": analyzed,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._wait_until_idle()
+            try:
+                done = await self.run()
+            except Exception as e:
+                log.error(f"Database maintenance failed: {e}")
+            else:
+                log.info(f"Database maintenance ran: {', '.join(done) or 'nothing'}.")
+
+    async def _wait_until_idle(self) -> None:
+        statements = self._db.latency.count
+        while True:
+            await asyncio.sleep(self.idleFor)
+            if self._db.latency.count == statements:
+                return
+            statements = self._db.latency.count
@@ -0,0 +1,184 @@
+"""Versioned schema migrations.
+
+Every migration is a numbered step that takes the schema from the previous
+version to its own. `migrate` runs the steps a database has not seen yet, in
+order and in a single transaction, then records the new version in the
+`schema_version` table. A database that is already current is only read.
+
+Steps describe the schema as it was at their version and must never change
+once released; a schema change is always a new step at the end of MIGRATIONS.
+"""
+
+import logging
+import sqlite3
+from typing import Awaitable, Callable, List, Tuple
+
+from .database import Database, Transaction
+
+log = logging.getLogger(__name__)
+
+Step = Callable[[Transaction], Awaitable[None]]
+
+
+async def _create_tables(tx: Transaction) -> None:
+    # Databases from before versioning already have some of this, possibly a
+    # players table from before guilds or targets existed, so every statement
+    # tolerates existing objects
+    await tx.execute(
+        """CREATE TABLE IF NOT EXISTS guilds (
+            guildID BIGINT PRIMARY KEY,
+            prefix TEXT NOT NULL DEFAULT '!',
+            assassinsChannelID BIGINT,
+            assassinsStarted BOOLEAN DEFAULT FALSE
+        );
+        """
+    )
+
+    players = """CREATE TABLE IF NOT EXISTS assassins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guildID BIGINT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            discordID INTEGER NOT NULL,
+            photoURL TEXT,
+            wins INTEGER DEFAULT 0,
+            kills INTEGER DEFAULT 0,
+            deaths INTEGER DEFAULT 0,
+            gamesPlayed INTEGER DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'Spectator',
+            targetID INTEGER
+        );
+        """
+    columns = await tx.execute("PRAGMA table_info(assassins);", fetch="all")
+    names = {column.name for column in columns or ()}
+    if columns and "guildID" not in names:
+        # Players are scoped to a guild, which is only known for their rows
+        # when the bot served a single guild
+        guilds = (await tx.execute("SELECT COUNT(*) FROM guilds;", fetch="one", raw=True))[0]
+        if guilds != 1:
+            # Keep the players aside rather than give them a guild no query
+            # asks for; they can be moved to the right guild by hand
+            orphaned = (
+                await tx.execute("SELECT COUNT(*) FROM assassins;", fetch="one", raw=True)
+            )[0]
+            log.warning(
+                f"Moved {orphaned} players from before guilds to the assassins_unassigned "
+                f"table, as their guild is unknown with {guilds} guilds on record."
+            )
+            await tx.execute("ALTER TABLE assassins RENAME TO assassins_unassigned;")
+            await tx.execute(players)
+            return
+
+        log.info("Rebuilding the assassins table with a guildID column.")
+        await tx.execute("ALTER TABLE assassins RENAME TO assassins_legacy;")
+        await tx.execute(players)
+        await tx.execute(
+            """INSERT INTO assassins (id, guildID, name, email, discordID,
+                photoURL, wins, kills, deaths, gamesPlayed, status)
+            SELECT id, (SELECT guildID FROM guilds), name, email, discordID,
+                photoURL, wins, kills, deaths, gamesPlayed, status
+            FROM assassins_legacy;
+            """
+        )
+        await tx.execute("DROP TABLE assassins_legacy;")
+    elif columns and "targetID" not in names:
+        await tx.execute("ALTER TABLE assassins ADD COLUMN targetID INTEGER;")
+    else:
+        await tx.execute(players)
+
+
+async def _integer_status(tx: Transaction) -> None:
+    # A column's type cannot be changed in place, so copy the players into a
+    # new table. Its indexes are dropped with the old table and made again.
+    await tx.execute(
+        """CREATE TABLE assassins_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guildID BIGINT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            discordID INTEGER NOT NULL,
+            photoURL TEXT,
+            wins INTEGER DEFAULT 0,
+            kills INTEGER DEFAULT 0,
+            deaths INTEGER DEFAULT 0,
+            gamesPlayed INTEGER DEFAULT 0,
+            status INTEGER NOT NULL DEFAULT 0,
+            targetID INTEGER
+        );
+        """
+    )
+    await tx.execute(
+        """INSERT INTO assassins_new (id, guildID, name, email, discordID, photoURL,
+            wins, kills, deaths, gamesPlayed, status, targetID)
+        SELECT id, guildID, name, email, discordID, photoURL, wins, kills, deaths,
+            gamesPlayed,
+            CASE status WHEN 'Alive' THEN 1 WHEN 'Dead' THEN 2 ELSE 0 END,
+            targetID
+        FROM assassins;
+        """
+    )
+    await tx.execute("DROP TABLE assassins;")
+    await tx.execute("ALTER TABLE assassins_new RENAME TO assassins;")
+
+    for index in [
+        "CREATE UNIQUE INDEX idx_assassins_guild_discord ON assassins (guildID, discordID);",
+        "CREATE UNIQUE INDEX idx_assassins_guild_email ON assassins (guildID, email);",
+        "CREATE INDEX idx_assassins_guild_status ON assassins (guildID, status);",
+        "CREATE INDEX idx_assassins_guild_target ON assassins (guildID, targetID);",
+        # Covers the leaderboard query so loading a guild's rankings never reads the table
+        "CREATE INDEX idx_assassins_guild_leaderboard ON assassins (guildID, wins DESC, kills DESC, discordID, name);",
+    ]:
+        await tx.execute(index)
+
+
+MIGRATIONS: List[Tuple[int, str, Step]] = [
+    (1, "Create the guilds and assassins tables", _create_tables),
+    (2, "Store player status as an integer and index players", _integer_status),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+async def _version(db: Database) -> int:
+    try:
+        row = await db.execute("SELECT version FROM schema_version;", fetch="one")
+    except sqlite3.OperationalError:
+        # A new database, or one from before versioning
+        return 0
+    return row.version if row else 0
+
+
+async def migrate(db: Database) -> int:
+    """Apply every migration newer than the database's schema version.
+
+    Returns the schema version, which is LATEST afterwards. Raises
+    RuntimeError for a database written by a newer version of the bot.
+    """
+    version = await _version(db)
+    if version == LATEST:
+        return version
+    if version > LATEST:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this bot supports ({LATEST})."
+        )
+
+    async with db.transaction() as tx:
+        await tx.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL);"
+        )
+        # Another process may have migrated since the version was read
+        row = await tx.execute("SELECT version FROM schema_version;", fetch="one")
+        version = row.version if row else 0
+
+        for step, description, apply in MIGRATIONS:
+            if step <= version:
+                continue
+            log.info(f"Migrating the database to version {step}: {description}.")
+            await apply(tx)
+
+        if row is None:
+            await tx.execute("INSERT INTO schema_version (version) VALUES (?);", (LATEST,))
+        else:
+            await tx.execute("UPDATE schema_version SET version = ?;", (LATEST,))
+
+    return LATEST
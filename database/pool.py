@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+log = logging.getLogger(__name__)
+
+
+async def configure(conn: aiosqlite.Connection, pragmas: Dict[str, object]) -> None:
+    """Apply PRAGMA settings to a freshly opened connection."""
+    for name, value in pragmas.items():
+        await conn.execute(f"PRAGMA {name} = {value};")
+
+
+class ConnectionPool:
+    """A fixed-size pool of long-lived aiosqlite connections."""
+
+    def __init__(
+        self,
+        dbName: str,
+        size: int = 4,
+        *,
+        pragmas: Optional[Dict[str, object]] = None,
+        closeTimeout: float = 10.0,
+    ):
+        if size < 1:
+            raise ValueError("Connection pool size must be at least 1.")
+
+        self.dbName = dbName
+        self.size = size
+        self.pragmas = pragmas or {}
+        # Seconds close() waits for borrowed connections before closing them anyway
+        self.closeTimeout = closeTimeout
+        self._connections: List[aiosqlite.Connection] = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._released = asyncio.Event()
+        self._closed = True
+
+    async def open(self) -> None:
+        """Open every connection in the pool."""
+        try:
+            for _ in range(self.size):
+                conn = await aiosqlite.connect(self.dbName)
+                self._connections.append(conn)
+                self._idle.put_nowait(conn)
+                await configure(conn, self.pragmas)
+        except Exception:
+            await self.close()
+            raise
+
+        self._closed = False
+
+    async def acquire(self) -> aiosqlite.Connection:
+        """Wait for an idle connection and take it out of the pool."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed.")
+
+        conn = await self._idle.get()
+        if self._closed:
+            # The pool started closing while this caller waited
+            self._idle.put_nowait(conn)
+            self._released.set()
+            raise RuntimeError("Connection pool is closed.")
+        return conn
+
+    async def release(self, conn: aiosqlite.Connection) -> None:
+        """Return a connection to the pool, discarding any unfinished transaction."""
+        if conn not in self._connections:
+            # Closed by a close() that gave up waiting for it
+            return
+        if conn.in_transaction:
+            await conn.rollback()
+
+        self._idle.put_nowait(conn)
+        self._released.set()
+
+    async def close(self) -> None:
+        """Close every connection in the pool once all of them have been released.
+
+        New acquires are refused from the start, but statements already holding
+        a connection get `closeTimeout` seconds to finish. Connections still
+        borrowed after that, e.g. by an abandoned iterate(), are closed anyway.
+        """
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._drain(), self.closeTimeout)
+        except asyncio.TimeoutError:
+            borrowed = len(self._connections) - self._idle.qsize()
+            log.warning(
+                f"Closing {borrowed} database connection(s) still borrowed "
+                f"after {self.closeTimeout}s."
+            )
+
+        connections, self._connections = self._connections, []
+        for conn in connections:
+            await conn.close()
+
+        self._idle = asyncio.Queue()
+
+    async def _drain(self) -> None:
+        while self._idle.qsize() < len(self._connections):
+            self._released.clear()
+            await self._released.wait()
@@ -0,0 +1,92 @@
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Callable, Optional, Tuple, Type
+
+
+class Record:
+    """A lightweight, slotted row record.
+
+    Subclasses list their columns in `__slots__`. Columns missing from a query
+    are left as None, and columns the record does not know about are dropped.
+    """
+
+    __slots__ = ()
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __hash__(self) -> int:
+        # Hashable like the namedtuple rows records replaced; as with those,
+        # don't change a record while it is in a set or used as a key
+        return hash((type(self),) + tuple(getattr(self, name) for name in self.__slots__))
+
+    def __copy__(self) -> "Record":
+        obj = type(self).__new__(type(self))
+        for name in self.__slots__:
+            setattr(obj, name, getattr(self, name))
+        return obj
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Player(Record):
+    __slots__ = (
+        "id",
+        "guildID",
+        "name",
+        "email",
+        "discordID",
+        "photoURL",
+        "wins",
+        "kills",
+        "deaths",
+        "gamesPlayed",
+        "status",
+        "targetID",
+    )
+
+
+class Guild(Record):
+    __slots__ = ("guildID", "prefix", "assassinsChannelID", "assassinsStarted")
+
+
+@lru_cache(maxsize=256)
+def row_factory(
+    columns: Tuple[str, ...], record: Optional[Type[Record]] = None
+) -> Callable[[Tuple], Any]:
+    """Build (once per column layout) a function turning a raw row into an object.
+
+    Without a record type, rows become instances of a namedtuple class that is
+    shared by every query returning the same columns.
+    """
+    if record is None:
+        return namedtuple("RowTuple", columns)._make
+
+    # Slot descriptors set attributes directly, skipping __init__ and __setattr__
+    setters = [
+        (index, getattr(record, name).__set__)
+        for index, name in enumerate(columns)
+        if name in record.__slots__
+    ]
+    missing = [
+        getattr(record, name).__set__
+        for name in record.__slots__
+        if name not in columns
+    ]
+    new = record.__new__
+
+    def factory(row: Tuple) -> Record:
+        obj = new(record)
+        for index, setter in setters:
+            setter(obj, row[index])
+        for setter in missing:
+            setter(obj, None)
+        return obj
+
+    return factory
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from .pool import configure
+
+log = logging.getLogger(__name__)
+
+Work = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class Writer:
+    """Owns the only writing connection and applies queued writes in batches.
+
+    Every statement submitted between two ticks of the writer task is executed
+    inside a single transaction and committed once (group commit). Each caller
+    gets its own future, resolved only after the batch containing its
+    statement has been committed. Between batches the connection can be
+    borrowed for a caller's own transaction with `exclusive()`.
+    """
+
+    def __init__(
+        self,
+        dbName: str,
+        *,
+        pragmas: Optional[Dict[str, object]] = None,
+        maxBatch: int = 256,
+    ):
+        self.dbName = dbName
+        self.pragmas = pragmas or {}
+        self.maxBatch = maxBatch
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._submitted = 0
+        self._completed = 0
+        self._progress = asyncio.Condition()
+        # Held while a batch commits or while the connection is borrowed
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        """Open the writing connection and start the writer task."""
+        self._conn = await aiosqlite.connect(self.dbName, isolation_level=None)
+        try:
+            await configure(self._conn, self.pragmas)
+        except Exception:
+            await self._conn.close()
+            self._conn = None
+            raise
+
+        self._task = asyncio.create_task(self._run(), name="database-writer")
+
+    async def close(self) -> None:
+        """Commit everything already queued, then stop the writer task."""
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def submit(self, work: Work) -> asyncio.Future:
+        """Queue a unit of work and return a future for its result."""
+        if self._task is None:
+            raise RuntimeError("Database writer is not running.")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((work, future))
+        self._submitted += 1
+        return future
+
+    @asynccontextmanager
+    async def exclusive(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow the writing connection, waiting for the current batch to commit.
+
+        Queued writes wait until the block exits. The block is responsible for
+        its own transaction and must leave none open.
+        """
+        if self._task is None:
+            raise RuntimeError("Database writer is not running.")
+
+        async with self._lock:
+            yield self._conn
+
+    async def drain(self) -> None:
+        """Wait until every write submitted so far has been committed or failed."""
+        target = self._submitted
+        if self._completed >= target:
+            return
+
+        async with self._progress:
+            await self._progress.wait_for(lambda: self._completed >= target)
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch = []
+            # Everything queued while the previous batch was committing goes into
+            # the same transaction as the first waiting item
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.maxBatch or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+
+            stopping = item is None
+            if batch:
+                try:
+                    async with self._lock:
+                        await self._commit(batch)
+                except Exception as e:
+                    # Whatever broke, the writer has to keep serving later writes
+                    log.error(f"The database writer failed on a batch of {len(batch)} writes: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                self._completed += len(batch)
+                async with self._progress:
+                    self._progress.notify_all()
+
+    async def _commit(self, batch: List[Tuple[Work, asyncio.Future]]) -> None:
+        # Statements are applied optimistically without savepoints. If one of
+        # them fails, the transaction is rolled back, that statement's caller
+        # gets the error and the rest of the batch is replayed.
+        pending = [item for item in batch if not item[1].done()]
+        # A batch that failed outright may have left its transaction open
+        await self._rollback()
+        while pending:
+            results = []
+            failed = None
+            try:
+                await self._conn.execute("BEGIN IMMEDIATE;")
+                for index, (work, _) in enumerate(pending):
+                    try:
+                        results.append(await work(self._conn))
+                    except Exception as e:
+                        failed = (index, e)
+                        break
+
+                if failed is None:
+                    await self._conn.execute("COMMIT;")
+            except Exception as e:
+                log.error(f"Failed to commit a batch of {len(pending)} writes: {e}")
+                await self._rollback()
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            if failed is None:
+                for (_, future), result in zip(pending, results):
+                    if not future.done():
+                        future.set_result(result)
+                return
+
+            await self._rollback()
+            index, error = failed
+            future = pending[index][1]
+            if not future.done():
+                future.set_exception(error)
+            pending = pending[:index] + pending[index + 1 :]
+
+    async def _rollback(self) -> None:
+        if self._conn.in_transaction:
+            await self._conn.execute("ROLLBACK;")
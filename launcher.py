@@ -43,7 +43,12 @@ def setup_logging():
 
 async def run_bot():
     async with UniteBot() as bot:
-        await bot.start()
+        try:
+            await bot.start()
+        finally:
+            # Write out buffered player stats before the database closes
+            if bot.db is not None:
+                await bot.db.assassins.counters.close()
 
 
 def main():
@@ -1,94 +1,494 @@
+import asyncio
 import pytest
-from unittest.mock import AsyncMock, MagicMock
-from aiosqlite import IntegrityError
+import pytest_asyncio
+from unittest.mock import MagicMock
+from database import Database, Player
 from database.assassins import Assassins, PlayerStatus
+from database.cache import MISS, PlayerCache
+from database.migrations import LATEST
+from database.records import row_factory
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    database = Database(str(tmp_path / "unite.db"))
+    await database.open()
+    await database.migrate()
+    yield database
+    await database.close()
+
+
+@pytest.fixture
+def guild():
+    return MagicMock(id=1)
+
+
+def member(discordID):
+    return MagicMock(id=discordID)
+
 
 @pytest.mark.asyncio
-async def test_create_table():
-    # Mock the database
-    mock_db = AsyncMock()
-    
-    # Initialize the Assassins class
-    assassins = Assassins(mock_db)
-
-    # Call create_table and check if it runs successfully
-    await assassins.create_table()
-    
-    # Ensure the execute method was called with the table creation command
-    mock_db.execute.assert_called()
-
-@pytest.mark.asyncio
-async def test_add_player():
-    # Mock the database
-    mock_db = AsyncMock()
-    mock_db.execute = AsyncMock(return_value=None)
-    assassins = Assassins(mock_db)
-    
-    # Add a player
-    await assassins.add_player("John Doe", "john@example.com", "12345", "photo_url")
-
-    # Assert the SQL insert query was called with the correct values
-    mock_db.execute.assert_called_once_with(
-        f"INSERT INTO assassins (name, email, discord_id, photo_url, wins, kills, deaths, status) "
-        "VALUES (?, ?, ?, ?, 0, 0, 0, ?);",
-        ("John Doe", "john@example.com", "12345", "photo_url", PlayerStatus.ALIVE.value)
+async def test_migrate(db):
+    indexes = await db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'assassins';",
+        fetch="all",
     )
+    assert {
+        "idx_assassins_guild_discord",
+        "idx_assassins_guild_email",
+        "idx_assassins_guild_status",
+    } <= {index.name for index in indexes}
+
+    # A current database is only asked for its version
+    db.audit = MagicMock()
+    assert await db.migrate() == LATEST
+    assert [call.args[0] for call in db.audit.register.call_args_list] == [
+        "SELECT version FROM schema_version;"
+    ]
+
+
+async def legacy_database(path, guildIDs):
+    """Create a database from before players were scoped to a guild."""
+    database = Database(path)
+    await database.run(
+        """CREATE TABLE guilds (
+            guildID BIGINT PRIMARY KEY,
+            prefix TEXT NOT NULL DEFAULT '!',
+            assassinsChannelID BIGINT,
+            assassinsStarted BOOLEAN DEFAULT FALSE
+        );"""
+    )
+    for guildID in guildIDs:
+        await database.guilds.add_guild(guildID)
+    await database.run(
+        """CREATE TABLE assassins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            discordID INTEGER NOT NULL UNIQUE,
+            photoURL TEXT,
+            wins INTEGER DEFAULT 0,
+            kills INTEGER DEFAULT 0,
+            deaths INTEGER DEFAULT 0,
+            gamesPlayed INTEGER DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'Spectator'
+        );"""
+    )
+    await database.run(
+        "INSERT INTO assassins (name, email, discordID, status) VALUES (?, ?, ?, ?);",
+        ("John Doe", "john@tamu.edu", 12345, "Dead"),
+    )
+    return database
+
 
 @pytest.mark.asyncio
-async def test_set_player_status():
-    # Mock the database
-    mock_db = AsyncMock()
-    assassins = Assassins(mock_db)
+async def test_migrate_legacy_players(tmp_path):
+    database = await legacy_database(str(tmp_path / "unite.db"), [1])
+    assert await database.migrate() == LATEST
+
+    player = await database.assassins.get_player_by_discord_id(
+        MagicMock(id=1), member(12345)
+    )
+    assert player.name == "John Doe"
+    assert player.status == PlayerStatus.DEAD.value
 
-    # Set the player status
-    await assassins.set_player_status("12345", PlayerStatus.DEAD.value)
 
-    # Assert the update query was called with the correct arguments
-    mock_db.execute.assert_called_once_with(
-        f"UPDATE assassins SET status = ? WHERE discord_id = ?;",
-        (PlayerStatus.DEAD.value, "12345")
+@pytest.mark.asyncio
+async def test_migrate_legacy_players_of_unknown_guild(tmp_path, caplog):
+    database = await legacy_database(str(tmp_path / "unite.db"), [1, 2])
+    assert await database.migrate() == LATEST
+
+    # With two guilds on record the players are kept aside, not guessed at
+    assert not await database.execute("SELECT * FROM assassins;", fetch="all")
+    rows = await database.execute("SELECT name FROM assassins_unassigned;", fetch="all")
+    assert [row.name for row in rows] == ["John Doe"]
+    assert "Moved 1 players" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_add_player(db, guild):
+    player, created = await db.assassins.add_player(
+        guild, "John Doe", "john@tamu.edu", member(12345), "photo_url"
+    )
+    assert created and player.discordID == 12345
+    # Registering twice or reusing an email returns the existing registration
+    player, created = await db.assassins.add_player(
+        guild, "John Doe", "john@tamu.edu", member(12345), "photo_url"
+    )
+    assert not created and player.discordID == 12345
+    player, created = await db.assassins.add_player(
+        guild, "Jane Doe", "john@tamu.edu", member(54321), "photo_url"
+    )
+    assert not created and player.discordID == 12345
+
+    players = await db.assassins.get_all_players(guild)
+    assert len(players) == 1
+    assert players[0].status == PlayerStatus.SPECTATOR.value
+
+
+@pytest.mark.asyncio
+async def test_concurrent_registrations_do_not_race(db, guild):
+    results = await asyncio.gather(
+        *(
+            db.assassins.add_player(guild, "John Doe", "john@tamu.edu", member(1), "")
+            for _ in range(10)
+        )
     )
 
+    assert [created for _, created in results].count(True) == 1
+    assert len(await db.assassins.get_all_players(guild)) == 1
+
+
+@pytest.mark.asyncio
+async def test_join_and_leave_game(db, guild):
+    assert await db.assassins.join_game(guild, member(1)) is None
+    assert await db.assassins.leave_game(guild, member(1)) is None
+
+    await db.assassins.add_player(guild, "John Doe", "john@tamu.edu", member(1), "")
+    assert await db.assassins.get_player_by_discord_id(guild, member(1))
+
+    joined = await db.assassins.join_game(guild, member(1))
+    assert joined.status == PlayerStatus.ALIVE.value
+    # The cached lookup sees the change
+    player = await db.assassins.get_player_by_discord_id(guild, member(1))
+    assert player.status == PlayerStatus.ALIVE.value
+
+    # Leaving returns the player as they were before
+    left = await db.assassins.leave_game(guild, member(1))
+    assert left.status == PlayerStatus.ALIVE.value
+    player = await db.assassins.get_player_by_discord_id(guild, member(1))
+    assert player.status == PlayerStatus.SPECTATOR.value
+
+    # Only an alive player leaves; the dead stay dead
+    await db.assassins.set_player_status(guild, member(1), PlayerStatus.DEAD)
+    assert (await db.assassins.leave_game(guild, member(1))).status == PlayerStatus.DEAD.value
+    player = await db.assassins.get_player_by_discord_id(guild, member(1))
+    assert player.status == PlayerStatus.DEAD.value
+
+
+@pytest.mark.asyncio
+async def test_players_are_scoped_to_guild(db, guild):
+    other = MagicMock(id=2)
+    await db.assassins.add_player(guild, "John Doe", "john@tamu.edu", member(1), "")
+    await db.assassins.add_player(other, "John Doe", "john@tamu.edu", member(1), "")
+
+    await db.assassins.set_player_status(guild, member(1), PlayerStatus.ALIVE)
+    await db.assassins.set_players_status(other, [1], PlayerStatus.DEAD)
+
+    assert (await db.assassins.get_player_by_discord_id(guild, member(1))).status == PlayerStatus.ALIVE.value
+    assert (await db.assassins.get_player_by_discord_id(other, member(1))).status == PlayerStatus.DEAD.value
+
+
+@pytest.mark.asyncio
+async def test_set_player_status(db, guild):
+    await db.assassins.add_player(guild, "John Doe", "john@tamu.edu", member(12345), "")
+
+    await db.assassins.set_player_status(guild, member(12345), PlayerStatus.DEAD)
+
+    player = await db.assassins.get_player_by_discord_id(guild, member(12345))
+    assert player.status == PlayerStatus.DEAD.value
+
+
+@pytest.mark.asyncio
+async def test_bulk_player_status(db, guild):
+    for discordID in range(1, 6):
+        await db.assassins.add_player(
+            guild, "Player", f"{discordID}@tamu.edu", member(discordID), ""
+        )
+    await db.assassins.set_players_status(guild, [1, 2, 3], PlayerStatus.ALIVE)
+
+    alive = await db.assassins.get_player_ids_by_status(guild, PlayerStatus.ALIVE)
+    assert alive == [1, 2, 3]
+
+    await db.assassins.set_players_status(guild, alive, PlayerStatus.SPECTATOR)
+    assert await db.assassins.get_player_ids_by_status(guild, PlayerStatus.ALIVE) == []
+
+
+@pytest.mark.asyncio
+async def test_get_player_by_discord_id(db, guild):
+    await db.assassins.add_player(guild, "John Doe", "john@tamu.edu", member(12345), "")
+
+    player = await db.assassins.get_player_by_discord_id(guild, member(12345))
+
+    assert isinstance(player, Player)
+    assert (player.name, player.discordID) == ("John Doe", 12345)
+    assert await db.assassins.get_player_by_discord_id(guild, member(1)) is None
+
+
+@pytest.mark.asyncio
+async def test_get_player_by_email(db, guild):
+    await db.assassins.add_player(guild, "John Doe", "john@tamu.edu", member(12345), "")
+
+    player = await db.assassins.get_player_by_email(guild, "john@tamu.edu")
+
+    assert (player.name, player.email) == ("John Doe", "john@tamu.edu")
+
+
+async def ring(db, guild):
+    """Follow the target ring from its first player back around to the start."""
+    players = {
+        player.discordID: player.targetID
+        for player in await db.assassins.get_all_players(guild)
+        if player.targetID is not None
+    }
+    order = [next(iter(players))] if players else []
+    while players and players[order[-1]] != order[0]:
+        order.append(players[order[-1]])
+    assert len(order) == len(players)
+    return order
+
+
+@pytest_asyncio.fixture
+async def game(db, guild):
+    for discordID in range(1, 6):
+        await db.assassins.add_player(
+            guild, "Player", f"{discordID}@tamu.edu", member(discordID), ""
+        )
+    await db.assassins.set_players_status(guild, range(1, 6), PlayerStatus.ALIVE)
+    assert await db.assassins.assign_targets(guild, seed=42) == 5
+    return db
+
+
 @pytest.mark.asyncio
-async def test_get_player_by_discord_id():
-    # Mock the database cursor and return a mock player
-    mock_cursor = AsyncMock()
-    mock_cursor.fetchone = AsyncMock(return_value={"name": "John Doe", "discord_id": "12345"})
+async def test_assign_targets_builds_seeded_ring(game, guild):
+    order = await ring(game, guild)
+    assert sorted(order) == [1, 2, 3, 4, 5]
+
+    await game.assassins.assign_targets(guild, seed=42)
+    assert await ring(game, guild) == order
 
-    # Mock the database
-    mock_db = AsyncMock()
-    mock_db.execute = AsyncMock(return_value=mock_cursor)
-    assassins = Assassins(mock_db)
 
-    # Fetch a player by discord_id
-    player = await assassins.get_player_by_discord_id("12345")
+@pytest.mark.asyncio
+async def test_eliminate_target_splices_ring(game, guild):
+    order = await ring(game, guild)
+    killer, victim, following = order[0], order[1], order[2]
 
-    # Check if the correct SQL query was made
-    mock_db.execute.assert_called_once_with(
-        f"SELECT * FROM assassins WHERE discord_id = ?;",
-        ("12345",)
+    assert (await game.assassins.get_target(guild, member(killer))).discordID == victim
+    assert await game.assassins.eliminate_target(guild, member(killer)) == (
+        victim,
+        following,
     )
-    # Ensure the player is correctly returned
-    assert player == {"name": "John Doe", "discord_id": "12345"}
+
+    assert sorted(await ring(game, guild)) == sorted(set(order) - {victim})
+    dead = await game.assassins.get_player_by_discord_id(guild, member(victim))
+    assert (dead.status, dead.deaths, dead.targetID) == (PlayerStatus.DEAD.value, 1, None)
+    assert (await game.assassins.get_player_by_discord_id(guild, member(killer))).kills == 1
+
+
+@pytest.mark.asyncio
+async def test_eliminate_target_checks_expected_target(game, guild):
+    order = await ring(game, guild)
+
+    assert await game.assassins.eliminate_target(guild, member(order[0]), targetID=order[2]) is None
+    assert await ring(game, guild) == order
+
 
 @pytest.mark.asyncio
-async def test_get_player_by_email():
-    # Mock the database cursor and return a mock player
-    mock_cursor = AsyncMock()
-    mock_cursor.fetchone = AsyncMock(return_value={"name": "John Doe", "email": "john@example.com"})
+async def test_last_player_standing(game, guild):
+    killer = (await ring(game, guild))[0]
+    for _ in range(3):
+        victim, nextID = await game.assassins.eliminate_target(guild, member(killer))
+        assert nextID is not None
 
-    # Mock the database
-    mock_db = AsyncMock()
-    mock_db.execute = AsyncMock(return_value=mock_cursor)
-    assassins = Assassins(mock_db)
+    victim, nextID = await game.assassins.eliminate_target(guild, member(killer))
+    assert nextID is None
+    assert await game.assassins.get_target(guild, member(killer)) is None
+
+
+@pytest.mark.asyncio
+async def test_forfeit_and_delete_close_ring(game, guild):
+    order = await ring(game, guild)
+
+    await game.assassins.forfeit_player(guild, member(order[1]))
+    await game.assassins.delete_player_by_discord_id(guild, member(order[3]))
+
+    remaining = await ring(game, guild)
+    assert sorted(remaining) == sorted(set(order) - {order[1], order[3]})
+
+
+@pytest.mark.asyncio
+async def test_forfeit_after_elimination_changes_nothing(game, guild):
+    order = await ring(game, guild)
+    await game.assassins.eliminate_target(guild, member(order[0]))
 
-    # Fetch a player by email
-    player = await assassins.get_player_by_email("john@example.com")
+    # The victim confirmed a forfeit after they had already been eliminated
+    assert not await game.assassins.forfeit_player(guild, member(order[1]))
+    victim = await game.assassins.get_player_by_discord_id(guild, member(order[1]))
+    assert victim.deaths == 1
+    assert sorted(await ring(game, guild)) == sorted([order[0]] + order[2:])
+
+
+@pytest.mark.asyncio
+async def test_leaderboard_tracks_stat_changes(game, guild):
+    # Loaded from the database on first use, then kept up to date in memory
+    assert await game.assassins.get_rank(guild, member(1)) == (1, 5)
+
+    killer = (await ring(game, guild))[0]
+    await game.assassins.eliminate_target(guild, member(killer))
+    await game.assassins.add_win(guild, member(killer))
+    await game.assassins.add_player(guild, "Late", "late@tamu.edu", member(6), "")
+
+    top = await game.assassins.get_leaderboard(guild, limit=2)
+    assert top[0] == (killer, "Player", 1, 1)
+    assert await game.assassins.get_rank(guild, member(6)) == (2, 6)
+
+    await game.assassins.delete_player_by_discord_id(guild, member(killer))
+    assert await game.assassins.get_rank(guild, member(killer)) is None
+
+    # A fresh load from the database agrees with the maintained rankings
+    expected = await game.assassins.get_leaderboard(guild)
+    await game.assassins.counters.flush()
+    fresh = Assassins(game)
+    assert await fresh.get_leaderboard(guild) == expected
+
+
+@pytest.mark.asyncio
+async def test_stat_changes_are_written_behind(game, guild):
+    order = await ring(game, guild)
+    victim, _ = await game.assassins.eliminate_target(guild, member(order[0]))
+
+    # Nothing is written yet, but reads include the pending changes
+    stored = await game.execute(
+        "SELECT kills FROM assassins WHERE guildID = ? AND discordID = ?;",
+        (guild.id, order[0]),
+        fetch="one",
+    )
+    assert stored.kills == 0
+    assert (await game.assassins.get_player_by_discord_id(guild, member(order[0]))).kills == 1
+    players = {p.discordID: p for p in await game.assassins.get_all_players(guild)}
+    assert players[victim].deaths == 1
+
+    await game.assassins.counters.flush()
+    assert game.assassins.counters.pending(guild.id, order[0]) is None
+    player = await game.assassins.get_player_by_discord_id(guild, member(order[0]))
+    assert (player.kills, player.deaths) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_counters_flush_at_threshold(game, guild):
+    game.assassins.counters.maxPending = 2
+    await game.assassins.add_win(guild, member(1))
+    await game.assassins.add_win(guild, member(2))
+    await asyncio.sleep(0.05)
 
-    # Check if the correct SQL query was made
-    mock_db.execute.assert_called_once_with(
-        f"SELECT * FROM assassins WHERE email = ?;",
-        ("john@example.com",)
+    rows = await game.execute(
+        "SELECT wins FROM assassins WHERE guildID = ? AND discordID IN (1, 2);",
+        (guild.id,),
+        fetch="all",
     )
-    # Ensure the player is correctly returned
-    assert player == {"name": "John Doe", "email": "john@example.com"}
+    assert [row.wins for row in rows] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_finish_game(game, guild):
+    await game.assassins.finish_game(guild)
+
+    players = await game.assassins.get_all_players(guild)
+    assert {p.status for p in players} == {PlayerStatus.SPECTATOR.value}
+    assert {p.targetID for p in players} == {None}
+    assert {p.gamesPlayed for p in players} == {1}
+
+    # Games played are written behind with the other stats
+    await game.assassins.counters.flush()
+    rows = await game.execute("SELECT gamesPlayed FROM assassins;", fetch="all", raw=True)
+    assert {row[0] for row in rows} == {1}
+
+
+@pytest.mark.asyncio
+async def test_leaving_a_guild_keeps_its_players(game, guild):
+    await game.guilds.add_guild(guild.id)
+    assert await game.assassins.get_rank(guild, member(1)) == (1, 5)
+    await game.assassins.add_win(guild, member(1))
+
+    await game.guilds.remove_guild(guild.id)
+    game.assassins.forget_guild(guild.id)
+
+    assert await game.guilds.get_guild(guild.id) is None
+    assert not game.assassins.leaderboard.is_loaded(guild.id)
+    # The players and their pending stats outlive the guild's in-memory state
+    await game.assassins.counters.flush()
+    player = await game.assassins.get_player_by_discord_id(guild, member(1))
+    assert player.wins == 1
+    assert len(await game.assassins.get_all_players(guild)) == 5
+
+
+@pytest.mark.asyncio
+async def test_iter_all_players_merges_pending_stats(game, guild):
+    await game.assassins.add_win(guild, member(3))
+
+    players = {p.discordID: p async for p in game.assassins.iter_all_players(guild, batch_size=2)}
+    assert sorted(players) == [1, 2, 3, 4, 5]
+    assert players[3].wins == 1
+
+
+@pytest.mark.asyncio
+async def test_iter_all_players_does_not_hold_off_flushes(tmp_path, guild):
+    database = Database(str(tmp_path / "unite.db"), wal=True)
+    await database.open()
+    await database.migrate()
+    for discordID in range(1, 4):
+        await database.assassins.add_player(
+            guild, "Player", f"{discordID}@tamu.edu", member(discordID), ""
+        )
+    await database.assassins.add_win(guild, member(1))
+
+    players = database.assassins.iter_all_players(guild, batch_size=1)
+    first = await anext(players)
+    # A consumer paused mid-stream does not stop the counters from flushing
+    await database.assassins.add_win(guild, member(3))
+    await asyncio.wait_for(database.assassins.counters.flush(), 1)
+
+    rest = [player async for player in players]
+    wins = {player.discordID: player.wins for player in [first, *rest]}
+    # Every row is counted as of when the stream started, exactly once
+    assert wins == {1: 1, 2: 0, 3: 0}
+    await database.close()
+
+
+@pytest.mark.asyncio
+async def test_player_lookups_are_cached(db, guild):
+    # Unregistered users are remembered, so repeat lookups skip the database
+    assert await db.assassins.get_player_by_discord_id(guild, member(1)) is None
+    assert await db.assassins.get_player_by_email(guild, "a@tamu.edu") is None
+    queries = db.latency.count
+    for _ in range(5):
+        assert await db.assassins.get_player_by_discord_id(guild, member(1)) is None
+        assert await db.assassins.get_player_by_email(guild, "a@tamu.edu") is None
+    assert db.latency.count == queries
+
+    await db.assassins.add_player(guild, "Player", "a@tamu.edu", member(1), "")
+    assert (await db.assassins.get_player_by_discord_id(guild, member(1))).name == "Player"
+    assert (await db.assassins.get_player_by_email(guild, "a@tamu.edu")).discordID == 1
+
+    await db.assassins.set_player_status(guild, member(1), PlayerStatus.ALIVE)
+    assert (await db.assassins.get_player_by_email(guild, "a@tamu.edu")).status == PlayerStatus.ALIVE.value
+
+    await db.assassins.delete_player_by_discord_id(guild, member(1))
+    assert await db.assassins.get_player_by_discord_id(guild, member(1)) is None
+    assert await db.assassins.get_player_by_email(guild, "a@tamu.edu") is None
+
+
+def test_records_compare_and_hash_by_value():
+    make = row_factory(("discordID", "email"), Player)
+    first, second = make((1, "1@tamu.edu")), make((1, "1@tamu.edu"))
+
+    assert first == second and first is not second
+    assert len({first, second, make((2, "2@tamu.edu"))}) == 2
+
+
+def test_player_cache_bounds_and_races():
+    cache = PlayerCache(maxEntries=2, ttl=60)
+    make = row_factory(("discordID", "email"), Player)
+    for discordID in range(3):
+        cache.put(1, discordID, make((discordID, f"{discordID}@tamu.edu")), cache.version())
+
+    # The least recently used player was evicted
+    assert cache.get(1, 0) is MISS
+    assert cache.get(1, 2).email == "2@tamu.edu"
+
+    # A lookup that started before a write does not cache what it read
+    version = cache.version()
+    cache.invalidate_guild(1)
+    cache.put(1, 3, None, version)
+    assert cache.get(1, 3) is MISS
+    assert cache.get(1, 2) is MISS
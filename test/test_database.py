@@ -0,0 +1,469 @@
+import asyncio
+import gc
+import logging
+import os
+import sqlite3
+from unittest.mock import MagicMock
+import aiosqlite
+import pytest
+import pytest_asyncio
+from database import Database, Guild
+from database.assassins import PlayerStatus
+from database.audit import QueryAudit
+from database.backups import Backups
+from database.pool import ConnectionPool
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    database = Database(str(tmp_path / "unite.db"), poolSize=2)
+    await database.open()
+    await database.migrate()
+    yield database
+    await database.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_connections(db):
+    async with db.acquire() as first:
+        pass
+    async with db.acquire() as second:
+        pass
+
+    # A pool of two hands out the idle connections in order, never new ones
+    async with db.acquire() as third:
+        assert third in (first, second)
+    assert first is not second
+
+
+@pytest.mark.asyncio
+async def test_pool_waits_for_release(db):
+    async with db.acquire():
+        async with db.acquire():
+            waiter = asyncio.create_task(db.execute("SELECT 1 AS one;", fetch="one"))
+            await asyncio.sleep(0.05)
+            assert not waiter.done()
+
+    assert (await waiter).one == 1
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_borrowed_connections(tmp_path):
+    database = Database(str(tmp_path / "unite.db"), poolSize=1)
+    await database.open()
+
+    async with database.acquire() as conn:
+        closing = asyncio.create_task(database.close())
+        await asyncio.sleep(0.05)
+        # The statement in flight still runs and its connection goes back cleanly
+        assert not closing.done()
+        async with conn.execute("SELECT 1;") as cursor:
+            assert (await cursor.fetchone())[0] == 1
+    await closing
+
+
+@pytest.mark.asyncio
+async def test_close_gives_up_on_leaked_connections(tmp_path, caplog):
+    pool = ConnectionPool(str(tmp_path / "unite.db"), size=2, closeTimeout=0.05)
+    await pool.open()
+    leaked = await pool.acquire()
+
+    await pool.close()
+    assert "Closing 1 database connection(s)" in caplog.text
+    with pytest.raises(ValueError):
+        await leaked.execute("SELECT 1;")
+    # Returning it late is harmless
+    await pool.release(leaked)
+
+
+@pytest.mark.asyncio
+async def test_execute_without_pool(tmp_path):
+    database = Database(str(tmp_path / "unite.db"))
+    await database.migrate()
+    await database.guilds.add_guild(1234)
+
+    assert await database.guilds.get_guild(1234)
+
+
+@pytest_asyncio.fixture
+async def wal_db(tmp_path):
+    database = Database(str(tmp_path / "unite.db"), poolSize=2, wal=True)
+    await database.open()
+    await database.migrate()
+    yield database
+    await database.close()
+
+
+@pytest.mark.asyncio
+async def test_wal_mode_enabled(wal_db):
+    result = await wal_db.execute("PRAGMA journal_mode;", fetch="one")
+    assert result.journal_mode == "wal"
+
+
+@pytest.mark.asyncio
+async def test_writer_group_commits_concurrent_writes(wal_db):
+    await asyncio.gather(*(wal_db.guilds.add_guild(guildID) for guildID in range(100)))
+
+    guilds = await wal_db.guilds.get_all_guilds()
+    assert len(guilds) == 100
+
+
+@pytest.mark.asyncio
+async def test_writer_isolates_failed_statements(wal_db):
+    results = await asyncio.gather(
+        wal_db.guilds.add_guild(1),
+        wal_db.guilds.add_guild(1),
+        wal_db.guilds.add_guild(2),
+        return_exceptions=True,
+    )
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], Exception)
+    assert len(await wal_db.guilds.get_all_guilds()) == 2
+
+
+@pytest.mark.asyncio
+async def test_writer_survives_a_failed_batch(wal_db, monkeypatch):
+    async def broken():
+        raise RuntimeError("rollback failed")
+
+    monkeypatch.setattr(wal_db._writer, "_rollback", broken)
+    with pytest.raises(Exception):
+        # The duplicate fails, and so does the rollback that follows it
+        await asyncio.gather(wal_db.guilds.add_guild(1), wal_db.guilds.add_guild(1))
+
+    monkeypatch.undo()
+    await wal_db.guilds.add_guild(2)
+    assert await wal_db.guilds.get_guild(2)
+
+
+@pytest.mark.asyncio
+async def test_wal_readers_are_read_only(wal_db):
+    async with wal_db.acquire() as conn:
+        with pytest.raises(Exception):
+            await conn.execute("INSERT INTO guilds (guildID) VALUES (1);")
+
+
+@pytest.mark.asyncio
+async def test_read_after_write(wal_db):
+    write = asyncio.create_task(wal_db.guilds.add_guild(1234))
+    await asyncio.sleep(0)
+
+    assert await wal_db.execute(
+        "SELECT guildID FROM guilds WHERE guildID = ?;",
+        (1234,),
+        fetch="one",
+        consistent=True,
+    )
+    await write
+
+
+@pytest_asyncio.fixture(params=[False, True], ids=["rollback-journal", "wal"])
+async def any_db(tmp_path, request):
+    database = Database(str(tmp_path / "unite.db"), poolSize=2, wal=request.param)
+    await database.open()
+    await database.migrate()
+    yield database
+    await database.close()
+
+
+@pytest.mark.asyncio
+async def test_transaction_commits_or_rolls_back(any_db):
+    async with any_db.transaction() as tx:
+        await tx.execute("INSERT INTO guilds (guildID) VALUES (1);")
+        row = await tx.execute(
+            "INSERT INTO guilds (guildID) VALUES (2) RETURNING guildID;", fetch="one"
+        )
+        assert row.guildID == 2
+
+    with pytest.raises(ZeroDivisionError):
+        async with any_db.transaction() as tx:
+            await tx.execute("INSERT INTO guilds (guildID) VALUES (3);")
+            1 / 0
+
+    guilds = await any_db.guilds.get_all_guilds()
+    assert [guild.guildID for guild in guilds] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_transaction_retries_while_busy(tmp_path):
+    database = Database(str(tmp_path / "unite.db"), poolSize=1)
+    await database.open()
+    await database.migrate()
+    # Fail fast on a held lock so only the transaction's own retries wait
+    async with database.acquire() as conn:
+        await conn.execute("PRAGMA busy_timeout = 0;")
+
+    async with aiosqlite.connect(database.dbName, isolation_level=None) as other:
+        await other.execute("BEGIN IMMEDIATE;")
+        with pytest.raises(sqlite3.OperationalError):
+            async with database.transaction(retries=0):
+                pass
+
+        async def release():
+            await asyncio.sleep(0.1)
+            await other.execute("COMMIT;")
+
+        releasing = asyncio.create_task(release())
+        async with database.transaction(retries=10, backoff=0.01) as tx:
+            await tx.execute("INSERT INTO guilds (guildID) VALUES (1);")
+        await releasing
+
+    assert await database.guilds.get_guild(1)
+    await database.close()
+
+
+@pytest.mark.asyncio
+async def test_transaction_holds_the_writer(wal_db):
+    async with wal_db.transaction() as tx:
+        write = asyncio.create_task(wal_db.guilds.add_guild(2))
+        await asyncio.sleep(0.05)
+        # Queued writes wait for the transaction to finish
+        assert not write.done()
+        await tx.execute("INSERT INTO guilds (guildID) VALUES (1);")
+    await write
+
+    guilds = await wal_db.guilds.get_all_guilds()
+    assert [guild.guildID for guild in guilds] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_rows_use_cached_record_types(db):
+    await db.guilds.add_guild(1)
+    await db.guilds.add_guild(2)
+
+    first, second = await db.guilds.get_all_guilds()
+    assert isinstance(first, Guild) and not hasattr(first, "__dict__")
+    assert (first.guildID, first.prefix) == (1, "!")
+
+    # Untyped rows with the same columns share one namedtuple class
+    rows = await db.execute("SELECT guildID FROM guilds;", fetch="all")
+    assert type(rows[0]) is type(rows[1])
+
+    raw = await db.execute("SELECT guildID FROM guilds;", fetch="all", raw=True)
+    assert raw == [(1,), (2,)]
+
+
+@pytest.mark.asyncio
+async def test_prefix_cache_is_write_through(db):
+    guild = MagicMock(id=1)
+    await db.guilds.add_guild(1)
+    await db.guilds.load_prefixes()
+    assert db.guilds.cached_prefix(1) == "!"
+
+    await db.guilds.set_prefix(guild, "u")
+    assert db.guilds.cached_prefix(1) == "u"
+
+    # Served from the cache even once the row has gone
+    await db.run("DELETE FROM guilds;")
+    assert await db.guilds.get_prefix(guild) == "u"
+
+
+@pytest.mark.asyncio
+async def test_get_allowed_columns(db):
+    assert await db.guilds.get_allowed_columns() == [
+        "guildID",
+        "prefix",
+        "assassinsChannelID",
+        "assassinsStarted",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sync_guilds_adds_missing(db):
+    await db.guilds.add_guild(1)
+
+    assert await db.guilds.sync_guilds([1, 2, 3]) == [2, 3]
+    assert await db.guilds.sync_guilds([1, 2, 3]) == []
+    assert db.guilds.cached_prefix(3) == "!"
+    assert len(await db.guilds.get_all_guilds()) == 3
+
+
+@pytest.mark.asyncio
+async def test_records_query_latency(wal_db):
+    before = wal_db.latency.count
+    await wal_db.run("CREATE TABLE t (x INTEGER);")
+    await wal_db.run_many("INSERT INTO t VALUES (?);", [(1,), (2,)])
+    await wal_db.execute("SELECT x FROM t;", fetch="all")
+
+    assert wal_db.latency.count - before == 3
+    assert all(p > 0 for p in wal_db.latency.percentiles(0.5, 0.99))
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_are_logged_with_plan(wal_db, caplog):
+    await wal_db.guilds.add_guild(1)
+    wal_db.slowQueryThreshold = 0
+
+    with caplog.at_level(logging.WARNING, logger="database.database"):
+        await wal_db.guilds.set_prefix(MagicMock(id=1), "?")
+        await wal_db.execute(
+            "SELECT * FROM assassins WHERE guildID = ? AND email = ?;",
+            (1, "a@tamu.edu"),
+            fetch="one",
+        )
+        await asyncio.sleep(0.05)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("UPDATE guilds" in m and "parameters: (str, int)" in m for m in messages)
+    assert any("idx_assassins_guild_email" in m for m in messages)
+
+
+@pytest.mark.asyncio
+async def test_registered_queries_do_not_scan_large_tables(db):
+    players = 2000
+    await db.guilds.add_guilds(range(1, players + 1))
+    await db.run_many(
+        "INSERT INTO assassins (guildID, name, email, discordID, status) VALUES (?, ?, ?, ?, ?);",
+        ((1, "Player", f"{i}@tamu.edu", i, PlayerStatus.ALIVE.value) for i in range(1, players + 1)),
+    )
+
+    audit = db.audit = QueryAudit(db)
+    guild, player = MagicMock(id=1), MagicMock(id=7)
+    await db.guilds.load_prefixes()
+    await db.guilds.get_channel(guild, "assassins")
+    await db.guilds.set_prefix(guild, "?")
+    await db.assassins.get_player_by_discord_id(guild, player)
+    await db.assassins.get_player_by_email(guild, "7@tamu.edu")
+    await db.assassins.add_player(guild, "Player", "7@tamu.edu", MagicMock(id=0), "")
+    await db.assassins.join_game(guild, player)
+    await db.assassins.leave_game(guild, player)
+    await db.assassins.set_player_status(guild, player, PlayerStatus.DEAD)
+    await db.assassins.assign_targets(guild, seed=1)
+    await db.assassins.get_target(guild, player)
+    await db.assassins.eliminate_target(guild, MagicMock(id=8))
+    await db.assassins.get_rank(guild, player)
+    await db.assassins.counters.flush()
+    await db.assassins.finish_game(guild)
+    await db.assassins.delete_player_by_discord_id(guild, player)
+
+    # Loading every prefix at startup is meant to read the whole table
+    assert await audit.scans(ignore=["SELECT guildID, prefix FROM guilds;"]) == []
+
+    await db.execute("SELECT * FROM assassins WHERE name = ?;", ("Player",), fetch="one")
+    assert [step for _, step in await audit.scans()] == [
+        "SCAN guilds",
+        "SCAN assassins",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_iterate_streams_in_batches(db):
+    await db.guilds.add_guilds(range(1, 1201))
+
+    batch = await db.execute("SELECT guildID FROM guilds;", fetch="many", size=100)
+    assert len(batch) == 100
+
+    streamed = [guild.guildID async for guild in db.guilds.iter_all_guilds(batch_size=64)]
+    assert streamed == list(range(1, 1201))
+
+    # Leaving a stream early returns its connection to the pool
+    async for _ in db.iterate("SELECT guildID FROM guilds;", batch_size=10):
+        break
+    await asyncio.gather(*(db.execute("SELECT 1 AS one;", fetch="one") for _ in range(4)))
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_reads_are_coalesced(db):
+    await db.guilds.add_guilds([1, 2])
+    reads, coalesced = db.reads, db.coalescedReads
+
+    guilds = await asyncio.gather(
+        *(db.guilds.get_guild(1) for _ in range(10)), db.guilds.get_guild(2)
+    )
+
+    assert db.reads - reads == 11
+    assert db.coalescedReads - coalesced == 9
+    assert [guild.guildID for guild in guilds] == [1] * 10 + [2]
+    # Every caller gets its own record
+    assert len({id(guild) for guild in guilds}) == 11
+
+
+@pytest.mark.asyncio
+async def test_failed_read_abandoned_by_its_callers_is_retrieved(db):
+    errors = []
+    asyncio.get_running_loop().set_exception_handler(
+        lambda loop, context: errors.append(context)
+    )
+
+    # The caller gives up, but the shielded read goes on and fails
+    reader = asyncio.ensure_future(db.execute("SELECT * FROM missing;", fetch="all"))
+    while not db._flights:
+        await asyncio.sleep(0)
+    reader.cancel()
+    while db._flights:
+        await asyncio.sleep(0.01)
+    del reader
+    gc.collect()
+
+    assert not errors
+
+
+@pytest.mark.asyncio
+async def test_reads_do_not_join_across_writes(db):
+    await db.guilds.add_guild(1)
+    query = "SELECT prefix FROM guilds WHERE guildID = 1;"
+
+    # The second read starts while the first is in flight, but after a write
+    # began, so it may not share a result that could predate the write
+    before = asyncio.ensure_future(db.execute(query, fetch="one"))
+    await asyncio.sleep(0)
+    write = asyncio.ensure_future(db.run("UPDATE guilds SET prefix = '?' WHERE guildID = 1;"))
+    await asyncio.sleep(0)
+    after = asyncio.ensure_future(db.execute(query, fetch="one"))
+
+    await asyncio.gather(before, write, after)
+    assert db.coalescedReads == 0
+
+
+@pytest.mark.asyncio
+async def test_maintenance_reclaims_free_pages(any_db):
+    maintenance = any_db.maintenance
+    await any_db.guilds.add_guilds(range(1, 5001))
+    await any_db.run("DELETE FROM guilds;")
+
+    stats = await maintenance.stats()
+    assert stats["autoVacuum"] == 2
+    assert stats["freelistSize"] > 0 and not stats["analyzed"]
+
+    # A run that is out of time does nothing
+    maintenance.timeLimit = 0
+    assert await maintenance.run() == []
+
+    maintenance.timeLimit = 10
+    done = await maintenance.run()
+    assert done[0] == "analyze" and "incremental_vacuum" in done
+    assert ("checkpoint" in done) == any_db.wal
+
+    stats = await maintenance.stats()
+    assert stats["freelistSize"] == 0 and stats["analyzed"]
+    assert (await maintenance.run())[0] == "optimize"
+
+
+@pytest.mark.asyncio
+async def test_backups_are_online_and_pruned(any_db, tmp_path):
+    backups = Backups(any_db, str(tmp_path / "backups"), keep=2, pages=8)
+    with pytest.raises(FileNotFoundError):
+        await backups.verify()
+    await any_db.guilds.add_guilds(range(1, 2001))
+
+    # In WAL mode writes carry on during the backup, which copies a snapshot
+    newer = range(2001, 2051) if any_db.wal else ()
+    writes = [any_db.guilds.add_guilds([guildID]) for guildID in newer]
+    path, *_ = await asyncio.gather(backups.backup(), *writes)
+
+    assert await backups.verify() == (path, ["ok"])
+    async with aiosqlite.connect(path) as conn:
+        async with conn.execute("SELECT COUNT(*) FROM guilds;") as cursor:
+            assert 2000 <= (await cursor.fetchone())[0] <= 2050
+        async with conn.execute("PRAGMA journal_mode;") as cursor:
+            assert (await cursor.fetchone())[0] == "delete"
+
+    await backups.backup()
+    newest = await backups.backup()
+    assert len(backups.paths()) == 2 and backups.paths()[-1] == newest
+    assert path not in backups.paths()
+    # No partial copies are left behind
+    assert sorted(os.listdir(backups.directory)) == [
+        os.path.basename(backup) for backup in backups.paths()
+    ]
@@ -0,0 +1,15 @@
+import pytest
+from benchmarks.load import simulate
+
+
+@pytest.mark.asyncio
+async def test_load_harness_plays_a_game(capsys):
+    harness = await simulate(
+        players=20, kills=10, concurrency=20, rtt=0, wal=True, seed=0
+    )
+
+    assert set(harness.stats) == {"register", "join", "start", "eliminate", "end"}
+    assert all(stats.errors == 0 for stats in harness.stats.values())
+    assert harness.stats["register"].rejected == 0
+    assert harness.stats["end"].rejected == 0
+    assert "/eliminate" in capsys.readouterr().out
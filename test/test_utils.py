@@ -0,0 +1,232 @@
+import asyncio
+import time
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+import aiohttp
+import discord
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from bot import UniteBot
+from utils.announcements import Announcer
+from utils.metrics import (
+    Histogram,
+    Instrumentation,
+    MetricsServer,
+    RuntimeMetrics,
+    normalize_sql,
+)
+from utils.utils import ImageValidator
+
+
+@pytest_asyncio.fixture
+async def server():
+    hits = {"HEAD": 0, "GET": 0}
+
+    async def image(request):
+        hits[request.method] += 1
+        return web.Response(body=b"\x89PNG", content_type="image/png")
+
+    async def page(request):
+        return web.Response(text="<html></html>", content_type="text/html")
+
+    async def no_head(request):
+        hits[request.method] += 1
+        if request.method == "HEAD":
+            raise web.HTTPMethodNotAllowed("HEAD", ["GET"])
+        return web.Response(body=b"\x89PNG", content_type="image/png")
+
+    async def huge(request):
+        return web.Response(
+            content_type="image/png", headers={"Content-Length": str(1024**3)}
+        )
+
+    app = web.Application()
+    app.router.add_route("*", "/image.png", image)
+    app.router.add_route("*", "/page", page)
+    app.router.add_route("*", "/nohead.png", no_head)
+    app.router.add_route("HEAD", "/huge.png", huge)
+
+    async with TestServer(app) as server:
+        server.hits = hits
+        yield server
+
+
+@pytest_asyncio.fixture
+async def validator():
+    validator = ImageValidator(maxBytes=1024)
+    await validator.open()
+    yield validator
+    await validator.close()
+
+
+@pytest.mark.asyncio
+async def test_validates_image_with_head(server, validator):
+    assert await validator.validate(str(server.make_url("/image.png")))
+    assert server.hits == {"HEAD": 1, "GET": 0}
+
+
+@pytest.mark.asyncio
+async def test_rejects_non_images(server, validator):
+    assert not await validator.validate(str(server.make_url("/page")))
+    assert not await validator.validate(str(server.make_url("/missing.png")))
+    assert not await validator.validate("not a url")
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_ranged_get(server, validator):
+    assert await validator.validate(str(server.make_url("/nohead.png")))
+    assert server.hits == {"HEAD": 1, "GET": 1}
+
+
+@pytest.mark.asyncio
+async def test_rejects_oversized_images(server, validator):
+    assert not await validator.validate(str(server.make_url("/huge.png")))
+
+
+@pytest.mark.asyncio
+async def test_caches_results(server, validator):
+    url = str(server.make_url("/image.png"))
+    for _ in range(5):
+        assert await validator.validate(url)
+
+    assert server.hits["HEAD"] == 1
+
+
+def announcer_bot(channel):
+    bot = MagicMock()
+    bot.db.guilds.get_channel = AsyncMock(return_value=1)
+    bot.get_channel.return_value = channel
+    return bot
+
+
+@pytest.mark.asyncio
+async def test_announcer_coalesces_bursts():
+    channel = MagicMock(send=AsyncMock())
+    announcer = Announcer(announcer_bot(channel), window=0.05)
+    guild = MagicMock(id=1)
+
+    for player in range(3):
+        announcer.announce(guild, f"Player {player} has been eliminated.")
+    await announcer.close()
+
+    channel.send.assert_awaited_once()
+    (embed,) = channel.send.await_args.kwargs["embeds"]
+    assert embed.description.count("eliminated") == 3
+
+
+@pytest.mark.asyncio
+async def test_announcer_backs_off_when_rate_limited():
+    channel = MagicMock(send=AsyncMock(side_effect=[discord.RateLimited(0.01), None]))
+    announcer = Announcer(announcer_bot(channel), window=0)
+
+    announcer.announce(MagicMock(id=1), "Player has been eliminated.")
+    await asyncio.sleep(0.1)
+
+    assert channel.send.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_announcer_close_skips_the_window_and_backoff():
+    channel = MagicMock(send=AsyncMock(side_effect=[discord.RateLimited(60), None, None]))
+    announcer = Announcer(announcer_bot(channel), window=0)
+
+    # One guild's worker is backing off from a rate limit, the other is
+    # waiting out its window
+    announcer.announce(MagicMock(id=1), "Player has been eliminated.")
+    await asyncio.sleep(0.01)
+    announcer.window = 60
+    announcer.announce(MagicMock(id=2), "Player has been eliminated.")
+    await asyncio.sleep(0)
+    await asyncio.wait_for(announcer.close(), 1)
+
+    assert channel.send.await_count == 3
+
+
+def test_histogram_percentiles_cover_recent_samples():
+    histogram = Histogram(size=100)
+    assert histogram.percentiles(0.5) == (None,)
+
+    for value in range(1, 251):
+        histogram.record(value)
+
+    # Only the last 100 samples (151-250) remain in the window
+    assert len(histogram) == 100
+    assert histogram.percentiles(0.5, 0.95, 0.99, 1.0) == (201, 246, 250, 250)
+
+
+@pytest.mark.asyncio
+async def test_runtime_metrics_sample_loop_lag():
+    metrics = RuntimeMetrics(interval=0.01)
+    metrics.start()
+    await asyncio.sleep(0.05)
+    time.sleep(0.05)  # Block the event loop
+    await asyncio.sleep(0.02)
+    await metrics.close()
+
+    assert metrics.loopLag.percentiles(1.0)[0] >= 0.04
+
+    started = metrics.begin()
+    assert metrics.inFlight == 1
+    metrics.end(started)
+    assert metrics.inFlight == 0 and len(metrics.commands) == 1
+
+
+@pytest.mark.asyncio
+async def test_tree_finishes_every_timed_interaction(monkeypatch):
+    bot = UniteBot()
+
+    async def fail_quietly(self, interaction):
+        await self.interaction_check(interaction)
+        interaction.command_failed = True
+
+    monkeypatch.setattr(discord.app_commands.CommandTree, "_call", fail_quietly)
+    command = MagicMock(qualified_name="register")
+    for type in (
+        discord.InteractionType.application_command,
+        discord.InteractionType.autocomplete,
+    ):
+        interaction = MagicMock(type=type, extras={}, command=command)
+        await bot.tree._call(interaction)
+
+    # Autocomplete is not timed, and a failed command is still finished
+    assert bot.metrics.inFlight == 0 and len(bot.metrics.commands) == 1
+    assert bot.instruments.commands["/register"].errors == 1
+    await bot.close()
+
+
+def test_normalize_sql_groups_statements_by_shape():
+    assert normalize_sql(
+        "SELECT *\n    FROM assassins WHERE guildID = 1 AND email = 'a@tamu.edu';"
+    ) == normalize_sql("SELECT * FROM assassins WHERE guildID = ? AND email = ?;")
+    assert normalize_sql("DELETE FROM t WHERE id IN (?, ?, ?);") == (
+        "DELETE FROM t WHERE id IN (?);"
+    )
+
+
+@pytest_asyncio.fixture
+async def metrics_server():
+    instruments = Instrumentation()
+    instruments.observe_command("/join", 0.003)
+    instruments.observe_command("/join", 2.0, error=True)
+    instruments.observe_query('SELECT "x" FROM t WHERE id = ?;', 0.0001)
+
+    server = MetricsServer(instruments.render, port=0)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_prometheus_text(metrics_server):
+    port = metrics_server._runner.addresses[0][1]
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.status == 200
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            body = await response.text()
+
+    assert 'unite_command_seconds_bucket{command="/join",le="0.005"} 1' in body
+    assert 'unite_command_seconds_count{command="/join"} 2' in body
+    assert 'unite_command_errors_total{command="/join"} 1' in body
+    assert 'unite_query_seconds_count{query="SELECT \\"x\\" FROM t WHERE id = ?;"} 1' in body
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, List
+
+import discord
+
+from utils.constants import EmbedColors
+
+if TYPE_CHECKING:
+    from bot import UniteBot
+
+log = logging.getLogger(__name__)
+
+# Discord's limits on a single message
+MAX_DESCRIPTION = 4096
+MAX_EMBEDS = 10
+
+
+class Announcer:
+    """Posts Assassins announcements to each guild's announcement channel.
+
+    Announcements are queued per guild and return immediately. A guild's
+    worker waits `window` seconds after the first queued line so that a burst
+    of eliminations is posted as one embed rather than one message each.
+    Closing wakes every waiting worker so the queues are posted at once.
+    """
+
+    def __init__(
+        self, bot: UniteBot, *, window: float = 2.0, maxAttempts: int = 5
+    ) -> None:
+        self.bot = bot
+        self.window = window
+        self.maxAttempts = maxAttempts
+        self._queues: Dict[int, Deque[str]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._closing = asyncio.Event()
+
+    def announce(self, guild: discord.Guild, line: str) -> None:
+        """Queue a line to be announced in the guild's Assassins channel."""
+        self._queues.setdefault(guild.id, deque()).append(line)
+        if guild.id not in self._workers:
+            self._workers[guild.id] = asyncio.create_task(
+                self._run(guild), name=f"announcer-{guild.id}"
+            )
+
+    async def close(self) -> None:
+        """Post everything still queued without waiting out the window or a backoff."""
+        self.window = 0
+        self._closing.set()
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _run(self, guild: discord.Guild) -> None:
+        queue = self._queues[guild.id]
+        try:
+            while queue:
+                await self._pause(self.window)
+                lines = list(queue)
+                queue.clear()
+                try:
+                    await self._send(guild, lines)
+                except Exception as e:
+                    log.error(f"Failed to post announcements in {guild.id}: {e}")
+        finally:
+            del self._workers[guild.id]
+            if not queue:
+                del self._queues[guild.id]
+
+    async def _send(self, guild: discord.Guild, lines: List[str]) -> None:
+        channelID = await self.bot.db.guilds.get_channel(guild, "assassins")
+        channel = self.bot.get_channel(channelID) if channelID else None
+        if channel is None:
+            log.warning(f"Dropped {len(lines)} announcement(s) in {guild.id}: no channel.")
+            return
+
+        embeds = self._build_embeds(lines)
+        for start in range(0, len(embeds), MAX_EMBEDS):
+            await self._deliver(channel, embeds[start : start + MAX_EMBEDS])
+
+    @staticmethod
+    def _build_embeds(lines: List[str]) -> List[discord.Embed]:
+        chunks: List[str] = []
+        for line in lines:
+            if chunks and len(chunks[-1]) + len(line) + 1 <= MAX_DESCRIPTION:
+                chunks[-1] += f"\n{line}"
+            else:
+                chunks.append(line[:MAX_DESCRIPTION])
+
+        return [
+            discord.Embed(
+                title="Assassins Announcement",
+                description=chunk,
+                color=EmbedColors.RED,
+            )
+            for chunk in chunks
+        ]
+
+    async def _deliver(
+        self, channel: discord.abc.Messageable, embeds: List[discord.Embed]
+    ) -> None:
+        # discord.py already waits out 429s and retries 5xx responses itself.
+        # What still reaches us is a rate limit longer than the client will
+        # wait (RateLimited) or a server error that outlasted its retries, so
+        # only those are retried here, and not at all once closing.
+        for attempt in range(self.maxAttempts):
+            try:
+                await channel.send(embeds=embeds)
+                return
+            except (discord.RateLimited, discord.DiscordServerError) as e:
+                if attempt == self.maxAttempts - 1 or self._closing.is_set():
+                    raise
+
+                delay = e.retry_after if isinstance(e, discord.RateLimited) else 2**attempt
+                log.warning(f"Announcement failed ({e}), retrying in {delay:.2f}s.")
+                await self._pause(delay)
+
+    async def _pause(self, delay: float) -> None:
+        # Sleep, but wake up as soon as the announcer closes
+        try:
+            await asyncio.wait_for(self._closing.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
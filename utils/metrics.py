@@ -0,0 +1,224 @@
+import asyncio
+import re
+import time
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+class Histogram:
+    """Ring buffer of the most recent `size` samples.
+
+    Recording a sample is a single array store, so it is cheap enough to call
+    on every query and command. Percentiles are computed on demand from
+    whatever samples are currently in the window.
+    """
+
+    __slots__ = ("size", "count", "_samples")
+
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.count = 0
+        self._samples = array("d", bytes(8 * size))
+
+    def record(self, value: float) -> None:
+        self._samples[self.count % self.size] = value
+        self.count += 1
+
+    def __len__(self) -> int:
+        return min(self.count, self.size)
+
+    def percentiles(self, *quantiles: float) -> Tuple[Optional[float], ...]:
+        """Get the given quantiles (0 to 1) of the window, or None when it is empty."""
+        samples = sorted(self._samples[: len(self)])
+        if not samples:
+            return (None,) * len(quantiles)
+
+        last = len(samples) - 1
+        return tuple(samples[min(last, int(q * len(samples)))] for q in quantiles)
+
+
+class RuntimeMetrics:
+    """Event-loop lag, command latency and in-flight interaction tracking.
+
+    A background task sleeps for `interval` seconds at a time and records how
+    much later than requested it woke up. That overshoot is time the event
+    loop spent running something else, so a high lag with fast queries points
+    at blocking code rather than the database.
+    """
+
+    def __init__(self, *, size: int = 1024, interval: float = 0.5):
+        self.interval = interval
+        self.loopLag = Histogram(size)
+        self.commands = Histogram(size)
+        self.inFlight = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start sampling the event-loop lag."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample(), name="loop-lag-sampler")
+
+    async def close(self) -> None:
+        """Stop sampling."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def begin(self) -> float:
+        """Count an interaction as in flight and return its start time."""
+        self.inFlight += 1
+        return time.perf_counter()
+
+    def end(self, start: float) -> None:
+        """Record an interaction started with `begin` as finished."""
+        self.inFlight -= 1
+        self.commands.record(time.perf_counter() - start)
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.loopLag.record(max(0.0, loop.time() - expected))
+
+
+# Upper bounds, in seconds, of the Prometheus histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    """Collapse a statement to a label shared by every call with the same shape."""
+    query = _WHITESPACE.sub(" ", query).strip()
+    query = _LITERALS.sub("?", query)
+    return _PLACEHOLDER_LISTS.sub("(?)", query)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Timing:
+    """Cumulative latency buckets, total time and error count for one label."""
+
+    __slots__ = ("buckets", "count", "sum", "errors")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+        index = bisect_left(BUCKETS, seconds)
+        if index < len(BUCKETS):
+            self.buckets[index] += 1
+
+
+class Instrumentation:
+    """Per-command and per-query timings, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self.commands: Dict[str, Timing] = {}
+        self.queries: Dict[str, Timing] = {}
+
+    def observe_command(self, name: str, seconds: float, error: bool = False) -> None:
+        timing = self.commands.get(name)
+        if timing is None:
+            timing = self.commands[name] = Timing()
+        timing.observe(seconds, error)
+
+    def observe_query(self, query: str, seconds: float, error: bool = False) -> None:
+        label = normalize_sql(query)
+        timing = self.queries.get(label)
+        if timing is None:
+            timing = self.queries[label] = Timing()
+        timing.observe(seconds, error)
+
+    @staticmethod
+    def top(timings: Dict[str, Timing], count: int) -> List[Tuple[str, Timing]]:
+        """Get the labels that took the most time in total."""
+        return sorted(timings.items(), key=lambda item: item[1].sum, reverse=True)[:count]
+
+    def render(self) -> str:
+        """Render every timing in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric, label, timings, help in (
+            ("unite_command", "command", self.commands, "Time taken by bot commands."),
+            ("unite_query", "query", self.queries, "Time taken by database statements."),
+        ):
+            lines += [
+                f"# HELP {metric}_seconds {help}",
+                f"# TYPE {metric}_seconds histogram",
+            ]
+            for name, timing in timings.items():
+                labels = f'{label}="{escape_label(name)}"'
+                cumulative = 0
+                for bound, hits in zip(BUCKETS, timing.buckets):
+                    cumulative += hits
+                    lines.append(f'{metric}_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines += [
+                    f'{metric}_seconds_bucket{{{labels},le="+Inf"}} {timing.count}',
+                    f"{metric}_seconds_sum{{{labels}}} {timing.sum}",
+                    f"{metric}_seconds_count{{{labels}}} {timing.count}",
+                ]
+
+            lines += [
+                f"# HELP {metric}_errors_total Failed {label} executions.",
+                f"# TYPE {metric}_errors_total counter",
+            ]
+            lines += [
+                f'{metric}_errors_total{{{label}="{escape_label(name)}"}} {timing.errors}'
+                for name, timing in timings.items()
+            ]
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Local HTTP server exposing `render()` at /metrics for Prometheus to scrape."""
+
+    def __init__(self, render: Callable[[], str], *, host: str = "127.0.0.1", port: int = 9100):
+        self.render = render
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        if self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        self._runner = runner
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            runner, self._runner = self._runner, None
+            await runner.cleanup()
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        # Version 0.0.4 of the text format is what Prometheus expects to scrape
+        return web.Response(
+            text=self.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
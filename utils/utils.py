@@ -1,23 +1,104 @@
-import aiohttp
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from urllib.parse import urlparse
 
+import aiohttp
+
+
+class ImageValidator:
+    """Checks whether URLs point at accessible images.
+
+    A single pooled HTTP session is shared by every check. Each URL is probed
+    with a HEAD request, falling back to a one-byte ranged GET for hosts that
+    refuse HEAD, and results are cached per URL for `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout: float = 5.0,
+        maxBytes: int = 8 * 1024 * 1024,
+        concurrency: int = 8,
+        ttl: float = 600.0,
+        maxEntries: int = 1024,
+    ):
+        self.timeout = timeout
+        self.maxBytes = maxBytes
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache: OrderedDict[str, Tuple[float, bool]] = OrderedDict()
+
+    async def open(self) -> None:
+        """Create the shared HTTP session."""
+        if self._session is not None:
+            return
+
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+        )
 
-async def validImageURL(url: str) -> bool:
-    """Check if the provided URL is a valid, accessible image."""
-    try:
+    async def close(self) -> None:
+        """Close the shared HTTP session."""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    async def validate(self, url: str) -> bool:
+        """Check if the provided URL is a valid, accessible image."""
         res = urlparse(url)
-        if not all([res.scheme, res.netloc]):
+        if res.scheme not in ("http", "https") or not res.netloc:
+            return False
+
+        cached = self._cache.get(url)
+        if cached is not None:
+            expires, valid = cached
+            if expires > time.monotonic():
+                self._cache.move_to_end(url)
+                return valid
+            del self._cache[url]
+
+        if self._session is None:
+            await self.open()
+
+        try:
+            async with self._semaphore:
+                valid = await self._probe(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            # Network failures may be transient, so they are not cached
             return False
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    return False
+        self._cache[url] = (time.monotonic() + self.ttl, valid)
+        if len(self._cache) > self.maxEntries:
+            self._cache.popitem(last=False)
+        return valid
+
+    async def _probe(self, url: str) -> bool:
+        async with self._session.head(url, allow_redirects=True) as response:
+            if response.status == 200:
+                return self._is_image(response)
+            if response.status in (404, 410):
+                return False
 
-                content_type = response.headers.get("Content-Type", "")
-                if not content_type.startswith("image/"):
-                    return False
+        async with self._session.get(
+            url, headers={"Range": "bytes=0-0"}, allow_redirects=True
+        ) as response:
+            if response.status not in (200, 206):
+                return False
+            return self._is_image(response)
+
+    def _is_image(self, response: aiohttp.ClientResponse) -> bool:
+        content_type = response.headers.get("Content-Type", "")
+        if not content_type.startswith("image/"):
+            return False
 
-        return True
-    except Exception:
-        return False
+        # A ranged response reports the full size after the slash in Content-Range
+        size = response.headers.get("Content-Range", "").rpartition("/")[2]
+        if not size.isdigit():
+            size = response.headers.get("Content-Length", "")
+        return not size.isdigit() or int(size) <= self.maxBytes